@@ -1,17 +1,49 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+from pydantic import BaseModel, Field
+from typing import Callable, List, Dict, Optional, Set, Tuple
+from collections import Counter
 from datetime import datetime, timedelta
+import asyncio
+import functools
 import json
+import logging
+import math
 import os
+import time
 import uvicorn
 from auction_agent import AuctionAgent, Product, Bid
+from auction_scheduler import AuctionScheduler
+from backplane import Backplane, BackplaneError, UnixBackplane
+from bid_engine import MAX_USER_LENGTH
+from bid_log import BidLog, DurabilityError
+from catalog import iter_catalog
+from conflation import DEFAULT_TICK_MS, Conflator
+from event_log import DEFAULT_CAPACITY, EventLog
+from fanout import DEFAULT_QUEUE_SIZE, Fanout, Subscriber
+from idempotency import DEFAULT_TTL as DEFAULT_IDEMPOTENCY_TTL, IdempotencyCache, IdempotencyConflict
+from loop_lag import LoopLagMonitor
+from metrics import CallbackCounter, Registry, TopCounter
+from rate_limit import ConcurrencyLimit, TokenBuckets
+from response_cache import DEFAULT_MAX_ENTRIES, ResponseCache, etag, not_modified
+from storage import MemoryStorage, SQLiteStorage
+from summaries import DEFAULT_MAX_ENTRIES as DEFAULT_SUMMARY_ENTRIES, SummaryCache, dumps, history_rows, summary
+from ws_protocol import KEYS, MSGPACK_PROTOCOL, Frame, loads, negotiate
+
+logger = logging.getLogger(__name__)
+
+class FastJSONResponse(Response):
+    """JSON encoded with orjson when it is installed; bytes pass through as already encoded"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
 
 app = FastAPI(title="OmniAuction API",
              description="REST API for OmniAuction Voice Agent",
-             version="1.0.0")
+             version="1.0.0",
+             default_response_class=FastJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -20,110 +52,872 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Metrics, served at /metrics. Updating one is a dict lookup and an add on
+# the event loop thread, with no locks; gauges are read only when scraped
+metrics = Registry()
+request_seconds = metrics.histogram("http_request_duration_seconds", "HTTP request latency by route and status",
+                                    ("route", "status"))
+bid_seconds = metrics.histogram("auction_bid_seconds", "Placing a bid until it is durable and broadcast, by outcome",
+                                ("outcome",))
+find_product_seconds = metrics.histogram("auction_find_product_seconds", "Looking up a product by id or name")
+broadcast_seconds = metrics.histogram("auction_broadcast_seconds",
+                                      "Fanning an event out to this worker's WebSocket clients", ("type",))
+ws_accept_seconds = metrics.histogram("websocket_accept_seconds", "Accepting a WebSocket, replay of missed events included")
+ws_disconnects = metrics.counter("websocket_disconnects_total", "WebSocket connections closed")
+product_bids = metrics.register(TopCounter(
+    "auction_product_bids_total", "Bids placed per product (only the busiest are exported)", "product_id",
+    int(os.environ.get("METRICS_TOP_PRODUCTS", "100"))))
+metrics.gauge("websocket_connections", "Open WebSocket connections by stream",
+              lambda: {("raw",): len(manager.fanout), ("conflated",): manager.connection_count() - len(manager.fanout)}, ("stream",))
+metrics.gauge("auction_bids_in_flight", "Bids admitted and not yet answered", lambda: bids_in_flight.active)
+metrics.gauge("auction_products", "Products in the catalog", lambda: len(manager.agent.products))
+metrics.gauge("event_loop_lag_seconds", "How late the event loop is running timers", lambda: loop_lag.lag)
+metrics.gauge("auction_event_seq", "Sequence number of the latest event", lambda: manager.events.seq)
+metrics.register(CallbackCounter("auction_response_cache_hits_total", "Product responses served from the cache",
+                                 lambda: response_cache.hits))
+metrics.register(CallbackCounter("auction_response_cache_misses_total", "Product responses built afresh",
+                                 lambda: response_cache.misses))
+
+def timed(route: str, status_code: int = 200):
+    """Record an endpoint's latency in request_seconds under ``route``; ``status_code``
+    is the endpoint's own, for when it returns something other than a Response"""
+    def decorate(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await endpoint(*args, **kwargs)
+                status = response.status_code if isinstance(response, Response) else status_code
+                return response
+            except HTTPException as exc:
+                status = exc.status_code
+                raise
+            finally:
+                request_seconds.observe(time.perf_counter() - started, route, str(status))
+        return wrapper
+    return decorate
+
+def find_product(key: str) -> Optional[Product]:
+    started = time.perf_counter()
+    product = manager.agent._find_product(key)
+    find_product_seconds.observe(time.perf_counter() - started)
+    return product
+
 # WebSocket manager
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # Clients that get every event as it happens
+        self.fanout = Fanout()
         self.agent = AuctionAgent()
+        self.events = EventLog(int(os.environ.get("EVENT_BUFFER_SIZE", DEFAULT_CAPACITY)))
+        self.queue_size = int(os.environ.get("SEND_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+        # Clients that get at most one bid update per product per tick; the
+        # default stream unless conflation is turned off with CONFLATION_TICK_MS=0
+        tick_ms = float(os.environ.get("CONFLATION_TICK_MS", DEFAULT_TICK_MS))
+        self.conflated: Optional[Fanout] = Fanout() if tick_ms > 0 else None
+        self.conflator = Conflator(tick_ms / 1000, self.publish_conflated) if tick_ms > 0 else None
+
+    async def connect(self, websocket: WebSocket, since: Optional[int] = None, epoch: Optional[str] = None,
+                      topics: Optional[Set[str]] = None, raw: bool = False,
+                      protocol: Optional[str] = None) -> Subscriber:
+        """Accept a client (in the negotiated subprotocol, if any) and queue what
+        it missed after ``since`` ahead of the live stream"""
+        started = time.perf_counter()
+        await websocket.accept(subprotocol=protocol)
+        binary = protocol == MSGPACK_PROTOCOL
+        subscriber = Subscriber(websocket, self.snapshot, self.queue_size, topics, binary)
+        cursor = self.events.seq if since is None else since
+        hello = {"type": "hello", "seq": cursor, "epoch": self.events.epoch}
+        if binary:
+            hello.update(protocol=protocol, keys=KEYS)
+        subscriber.send(Frame(hello))
+        # No await from here until the subscriber is registered, so no event
+        # can fall between the replay and the live stream
+        missed = self.events.since(cursor, epoch)
+        if missed is None or len(missed) >= subscriber.capacity:
+            subscriber.request_snapshot()
+        else:
+            for event in missed:
+                if subscriber.wants(event_topics(event)):
+                    subscriber.send(Frame(event), event["seq"])
+        if raw or self.conflated is None:
+            self.fanout.add(subscriber)
+        else:
+            self.conflated.add(subscriber)
+        ws_accept_seconds.observe(time.perf_counter() - started)
+        return subscriber
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    def connection_count(self) -> int:
+        return len(self.fanout) + (0 if self.conflated is None else len(self.conflated))
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    def fanout_of(self, subscriber: Subscriber) -> Fanout:
+        if self.conflated is not None and subscriber in self.conflated.subscribers:
+            return self.conflated
+        return self.fanout
+
+    def disconnect(self, subscriber: Subscriber):
+        self.fanout_of(subscriber).remove(subscriber)
+        ws_disconnects.inc()
+
+    def snapshot(self, topics: Optional[Set[str]] = None) -> dict:
+        """Current state of every auction (or just the subscribed ones), for clients too far behind to replay"""
+        if topics is None:
+            products = self.agent.products.values()
+        else:
+            products = [product for product in map(self.agent.index.get, sorted(topics)) if product is not None]
+        return {
+            "type": "snapshot",
+            "seq": self.events.seq,
+            "epoch": self.events.epoch,
+            "products": [
+                {
+                    "id": product.id,
+                    "current_highest_bid": product.current_highest_bid,
+                    "time_remaining": product.time_remaining(),
+                    "bids_count": len(product.bidding_history),
+                    "ended": product.has_ended()
+                }
+                for product in products
+            ]
+        }
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                self.active_connections.remove(connection)
+        # Serialized once; each subscriber's own task does the sending, and
+        # the other workers get the same text for their own clients
+        self.events.append(message)
+        text = json.dumps(message)
+        backplane.publish(text)
+        self.deliver(message, text)
+
+    def deliver(self, message: dict, text: Optional[str] = None):
+        """Send an already sequenced event to this worker's clients"""
+        started = time.perf_counter()
+        # Encoded on first use, once per wire format, whichever clients get it
+        frame = Frame(message, text)
+        topics = event_topics(message)
+        self.fanout.publish(frame, message["seq"], topics)
+        # Every worker sees every bid here, whichever one placed it
+        if message["type"] == "bid_placed":
+            product_bids.inc(message["product_id"])
+        elif message["type"] == "bid_batch":
+            for bid in message["bids"]:
+                product_bids.inc(bid["product_id"])
+        if self.conflated is not None:
+            if message["type"] == "bid_placed":
+                self.conflator.add(message, message["seq"])
+            elif message["type"] == "bid_batch":
+                for bid in message["bids"]:
+                    self.conflator.add(bid, message["seq"])
+            else:
+                # Anything else goes out now, after every pending price: its seq
+                # is newer than theirs, and a client resuming from it must not
+                # miss an update that was still held back
+                self.conflator.flush()
+                self.conflated.publish(frame, message["seq"], topics)
+        broadcast_seconds.observe(time.perf_counter() - started, message["type"])
+
+    def publish_conflated(self, update: dict):
+        self.conflated.publish(Frame(update), update["seq"], {update["product_id"]})
+
+    def resync(self):
+        """Send every client a fresh snapshot, after this worker's state was rebuilt"""
+        fanouts = [self.fanout] if self.conflated is None else [self.fanout, self.conflated]
+        for fanout in fanouts:
+            for subscriber in fanout.subscribers:
+                subscriber.request_snapshot()
+
+def event_topics(message: dict) -> Optional[Set[str]]:
+    """The product ids an event concerns; None for events every client gets"""
+    if message.get("type") == "bid_batch":
+        return {bid["product_id"] for bid in message["bids"]}
+    if "product_id" in message:
+        return {message["product_id"]}
+    return None
 
+def create_backplane() -> Backplane:
+    # Set BACKPLANE_PATH to run several uvicorn workers as one auction
+    path = os.environ.get("BACKPLANE_PATH")
+    return UnixBackplane(path) if path else Backplane()
+
+backplane = create_backplane()
 manager = ConnectionManager()
 
+async def close_auction(product: Product):
+    if not manager.agent.close_auction(product):
+        return
+    await manager.broadcast({
+        "type": "auction_ended",
+        "product_id": product.id,
+        "name": product.name,
+        "final_bid": product.current_highest_bid,
+        "winner": product.winner(),
+        "bids_count": len(product.bidding_history)
+    })
+
+scheduler = AuctionScheduler(close_auction)
+
+def mirror_event(message: dict):
+    """Follower: apply an event from the leader to this worker's copy, then pass it on to local clients"""
+    manager.events.record(message)
+    if message["type"] == "bid_placed":
+        mirror_bid(message)
+    elif message["type"] == "bid_batch":
+        for bid in message["bids"]:
+            mirror_bid(bid)
+    elif message["type"] == "auction_ended":
+        product = manager.agent.index.get(message["product_id"])
+        if product is not None:
+            manager.agent.close_auction(product)
+    manager.deliver(message)
+
+def mirror_bid(bid: dict):
+    product = manager.agent.index.get(bid["product_id"])
+    if product is not None:
+        # Workers share a machine and its clock, so this is the leader's timestamp give or take
+        manager.agent.mirror_bid(product, bid["user"], bid["amount"], int(time.time() * 1000))
+
+def sync_replica(hello: dict):
+    """Follower: (re)joined the leader; rebuild from storage if the events missed can't be replayed"""
+    if not hello["resync"]:
+        return
+    started = time.perf_counter()
+    restored = manager.agent.load(storage, persist=False, catalog=catalog_products())
+    manager.events.restart(hello["epoch"], hello["seq"])
+    manager.resync()
+    logger.info("Mirrored catalog and %d bids from storage in %.2fs", restored, time.perf_counter() - started)
+
+def create_storage():
+    backend = os.environ.get("STORAGE_BACKEND", "memory")
+    if backend == "sqlite":
+        path = os.environ.get("SQLITE_PATH", "data/auction.db")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return SQLiteStorage(path)
+    if backend == "memory":
+        return MemoryStorage(
+            BidLog(os.environ.get("BID_LOG_PATH", "data/bids.log")),
+            snapshot_path=os.environ.get("SNAPSHOT_PATH", "data/snapshot.bin"),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+storage = create_storage()
+# Set once the catalog and bids are recovered (or mirrored from the leader); until then /ready says no
+storage_recovered = False
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "300"))
+snapshot_task: Optional[asyncio.Task] = None
+
+async def write_snapshots():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            started = time.perf_counter()
+            captured = manager.agent.capture_snapshot()
+            await asyncio.to_thread(storage.write_snapshot, captured)
+            logger.info("Wrote snapshot in %.2fs", time.perf_counter() - started)
+        except Exception:
+            logger.exception("Failed to write snapshot")
+
+def catalog_products():
+    """(key, Product) pairs from CATALOG_PATH, merged in on load; ids already stored are skipped"""
+    catalog_path = os.environ.get("CATALOG_PATH")
+    return iter_catalog(catalog_path) if catalog_path else None
+
+@app.on_event("startup")
+async def load_storage():
+    global snapshot_task, storage_recovered
+    await backplane.start()
+    if not backplane.is_leader:
+        # Another worker owns storage; this one mirrors it and forwards bids there
+        await backplane.follow(manager.events, sync_replica, mirror_event)
+        storage_recovered = True
+        return
+    started = time.perf_counter()
+    # The catalog file is merged in before the bid log is replayed, so bids on its products are restored
+    restored = manager.agent.load(storage, catalog=catalog_products())
+    logger.info("Loaded catalog and replayed %d bids in %.2fs", restored, time.perf_counter() - started)
+    if getattr(storage, "snapshot_path", None):
+        if storage.catalog_dirty:
+            # Products created on this start (defaults, imports) only survive a
+            # restart in a snapshot, and followers rebuild from it with these end times
+            storage.write_snapshot(manager.agent.capture_snapshot())
+        snapshot_task = asyncio.create_task(write_snapshots())
+    storage_recovered = True
+    await backplane.serve(execute, manager.events)
+
+@app.on_event("shutdown")
+async def close_storage():
+    await backplane.close()
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+        # Leave a fresh snapshot behind so the next start replays almost nothing;
+        # not once the log has failed, as it couldn't be made to match one
+        if storage.failed is None:
+            try:
+                storage.write_snapshot(manager.agent.capture_snapshot())
+            except Exception:
+                logger.exception("Failed to write snapshot on shutdown")
+    storage.close()
+
+@app.on_event("startup")
+async def start_scheduler():
+    # Only the leader closes auctions; followers mirror its auction_ended events
+    if not backplane.is_leader:
+        return
+    for product in manager.agent.products.values():
+        if not product.closed:
+            scheduler.schedule(product)
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
+@app.on_event("startup")
+async def start_conflation():
+    if manager.conflator is not None:
+        manager.conflator.start()
+
+@app.on_event("shutdown")
+async def stop_conflation():
+    if manager.conflator is not None:
+        await manager.conflator.stop()
+
+loop_lag = LoopLagMonitor()
+
+@app.on_event("startup")
+async def start_loop_lag():
+    loop_lag.start()
+
+@app.on_event("shutdown")
+async def stop_loop_lag():
+    await loop_lag.stop()
+
 # Models
 class BidRequest(BaseModel):
-    user: str
-    amount: float
+    user: str = Field(..., max_length=MAX_USER_LENGTH)
+    amount: float = Field(..., allow_inf_nan=False)
+    product_id: str
+    expected_highest: Optional[float] = Field(None, allow_inf_nan=False)
+
+class ProxyBidRequest(BaseModel):
+    user: str = Field(..., max_length=MAX_USER_LENGTH)
+    max_amount: float = Field(..., allow_inf_nan=False)
     product_id: str
 
+# Batches (e.g. from relay partners placing bids for many users) are charged
+# to their own per-client bucket, which must hold a whole batch
+BATCH_BURST_PER_CLIENT = float(os.environ.get("BID_BURST_PER_BATCH_CLIENT", "1000"))
+MAX_BATCH_SIZE = max(1, min(1000, int(BATCH_BURST_PER_CLIENT)))
+
+class BidBatchRequest(BaseModel):
+    bids: List[BidRequest] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
 class VoiceCommand(BaseModel):
     text: str
     session_id: str
 
+def bid_event(product: Product, user: str, amount: float, message: str) -> dict:
+    return {
+        "type": "bid_placed",
+        "product_id": product.id,
+        "user": user,
+        "amount": amount,
+        "message": message
+    }
+
+# Summaries carry an absolute ends_at next to time_remaining, so a client
+# revalidating with If-None-Match can keep its countdown current
+summaries = SummaryCache(int(os.environ.get("SUMMARY_CACHE_SIZE", DEFAULT_SUMMARY_ENTRIES)))
+response_cache = ResponseCache(int(os.environ.get("RESPONSE_CACHE_SIZE", DEFAULT_MAX_ENTRIES)))
+
+def versioned_response(key: tuple, version: int, if_none_match: Optional[str],
+                       build: Callable[[], Tuple[bytes, Dict[str, str]]]) -> Response:
+    """JSON bytes from ``build()`` (body, headers), built once per version and
+    answered with 304 when the client already has that version"""
+    tag = etag(version)
+    if not_modified(if_none_match, tag):
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+    cached = response_cache.get(key, version)
+    if cached is None:
+        body, headers = build()
+        response_cache.put(key, version, body, headers)
+    else:
+        body, headers = cached
+    return FastJSONResponse(body, headers={**headers, "ETag": tag, "Cache-Control": "no-cache"})
+
 # API Endpoints
-@app.get("/api/products", response_model=List[Dict])
-async def list_products():
-    """Get list of all auction products"""
-    return [
-        {
-            "id": product.id,
-            "name": product.name,
-            "description": product.description,
-            "current_highest_bid": product.current_highest_bid,
-            "time_remaining": product.time_remaining(),
-            "bids_count": len(product.bidding_history)
-        }
-        for product in manager.agent.products.values()
-    ]
+MAX_PAGE_SIZE = 1000
+
+@app.get("/api/products")
+@timed("/api/products")
+async def list_products(
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = Query(None, pattern="^(active|ended)$"),
+    min_bid: Optional[float] = None,
+    max_bid: Optional[float] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get a page of auction products; the next page's cursor is in X-Next-Cursor"""
+    predicate = None
+    if status is not None or min_bid is not None or max_bid is not None:
+        def predicate(product: Product) -> bool:
+            if status is not None and product.has_ended() != (status == "ended"):
+                return False
+            if min_bid is not None and product.current_highest_bid < min_bid:
+                return False
+            if max_bid is not None and product.current_highest_bid > max_bid:
+                return False
+            return True
+    
+    def build():
+        page, next_cursor = manager.agent.page_products(cursor, limit, predicate)
+        headers = {} if next_cursor is None else {"X-Next-Cursor": str(next_cursor)}
+        return summaries.encode_list(page), headers
+    
+    # Any change to any product is a new catalog version
+    key = ("products", cursor, limit, status, min_bid, max_bid)
+    return versioned_response(key, manager.agent.version, if_none_match, build)
+
+MAX_SEARCH_RESULTS = 100
+
+@app.get("/api/search")
+@timed("/api/search")
+async def search_products(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=MAX_SEARCH_RESULTS)):
+    """Full-text search over live auctions, best match first"""
+    now = time.time()
+    return FastJSONResponse(b"[" + b",".join([
+        summaries.encode(product, now, b',"score":' + dumps(round(score, 4)))
+        for product, score in manager.agent.search_products(q, limit)
+    ]) + b"]")
+
+MAX_HISTORY_PAGE = 1000
+PRODUCT_FIELDS = ("id", "name", "description", "current_highest_bid", "time_remaining", "ends_at",
+                  "bids_count", "bidding_history", "history_cursor")
 
-@app.get("/api/products/{product_id}", response_model=Dict)
-async def get_product(product_id: str):
-    """Get details of a specific product"""
-    product = manager.agent._find_product(product_id)
+@app.get("/api/products/{product_id}")
+@timed("/api/products/{product_id}")
+async def get_product(
+    product_id: str,
+    history_cursor: Optional[int] = Query(None, ge=0),
+    history_limit: int = Query(10, ge=1, le=MAX_HISTORY_PAGE),
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    fields: Optional[str] = None,
+    timestamps: str = Query("iso", pattern="^(iso|epoch)$"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get details of a specific product with a page of its bidding history"""
+    product = find_product(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return {
-        "id": product.id,
-        "name": product.name,
-        "description": product.description,
-        "current_highest_bid": product.current_highest_bid,
-        "time_remaining": product.time_remaining(),
-        "bids_count": len(product.bidding_history),
-        "bidding_history": [
-            {"user": bid.user, "amount": bid.amount, "timestamp": bid.timestamp.isoformat()}
-            for bid in product.bidding_history[-10:]
-        ]
-    }
+    wanted = None
+    if fields is not None:
+        wanted = [field for field in fields.split(",") if field]
+        unknown = sorted(set(wanted) - set(PRODUCT_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Error: Unknown fields {', '.join(unknown)}")
+    
+    def build():
+        # The newest history_limit bids placed in [since, until) (epoch ms), or
+        # those just before history_cursor; history_cursor in the response
+        # pages further back and is null once there is nothing older
+        history = product.bidding_history
+        start, end = history.span(since, until)
+        if history_cursor is not None:
+            end = max(start, min(end, history_cursor))
+        page_start = max(start, end - history_limit)
+        next_cursor = page_start if page_start > start else None
+        epoch = timestamps == "epoch"
+        
+        if wanted is None:
+            extra = (b',"bidding_history":' + dumps(history_rows(history, page_start, end, epoch))
+                     + b',"history_cursor":' + dumps(next_cursor))
+            return summaries.encode(product, extra=extra), {}
+        payload = summary(product)
+        if "bidding_history" in wanted:
+            payload["bidding_history"] = history_rows(history, page_start, end, epoch)
+        payload["history_cursor"] = next_cursor
+        return dumps({field: payload[field] for field in wanted}), {}
+    
+    key = ("product", product.id, history_cursor, history_limit, since, until, fields, timestamps)
+    return versioned_response(key, product.version, if_none_match, build)
+
+async def commit_bid(product: Product, user: str, amount: float, expected_highest: Optional[float] = None) -> str:
+    """Place a bid and, if it is accepted, wait until it is durable and broadcast it"""
+    started = time.perf_counter()
+    result, proxy_bids = manager.agent.submit_bid(product, user, amount, expected_highest)
+    
+    if result.startswith("Error"):
+        bid_seconds.observe(time.perf_counter() - started, "rejected")
+        return result
+    
+    # Don't acknowledge until the bid is durable; concurrent bids share the fsync
+    await asyncio.wrap_future(storage.sync())
+    
+    # Broadcast the new bid, and any proxy counter-bids, to all connected clients
+    await manager.broadcast(bid_event(product, user, amount, result))
+    for proxy_user, proxy_amount, message in proxy_bids:
+        await manager.broadcast(bid_event(product, proxy_user, proxy_amount, message))
+    
+    bid_seconds.observe(time.perf_counter() - started, "accepted")
+    return result
+
+async def commit_proxy_bid(product: Product, user: str, max_amount: float) -> str:
+    """Register a proxy bid and broadcast any bids it places right away"""
+    result, proxy_bids = manager.agent.register_proxy_bid(product, user, max_amount)
+    
+    if proxy_bids:
+        await asyncio.wrap_future(storage.sync())
+        for proxy_user, amount, message in proxy_bids:
+            await manager.broadcast(bid_event(product, proxy_user, amount, message))
+    
+    return result
+
+async def commit_bids(bids: List[dict]) -> dict:
+    """Place an ordered batch of bids with one fsync and one broadcast"""
+    results = manager.agent.place_bids([
+        (bid["product_id"], bid["amount"], bid["user"], bid.get("expected_highest")) for bid in bids
+    ])
+    
+    accepted = []
+    response = []
+    for bid, (product, result, proxy_bids) in zip(bids, results):
+        if result.startswith("Success"):
+            accepted.append(bid_event(product, bid["user"], bid["amount"], result))
+            accepted.extend(bid_event(product, user, amount, message) for user, amount, message in proxy_bids)
+            response.append({"product_id": bid["product_id"], "status": "success", "message": result})
+        else:
+            response.append({"product_id": bid["product_id"], "status": "error", "message": result})
+    
+    if accepted:
+        # One fsync and one coalesced broadcast for the whole batch
+        await asyncio.wrap_future(storage.sync())
+        await manager.broadcast({"type": "bid_batch", "bids": accepted})
+    
+    return {"accepted": len(accepted), "results": response}
+
+# Outcomes of commands sent with an Idempotency-Key. Kept by the leader, so a
+# retry is recognised whichever worker it reaches.
+idempotency = IdempotencyCache(float(os.environ.get("IDEMPOTENCY_TTL", DEFAULT_IDEMPOTENCY_TTL)))
+
+async def execute(command: dict):
+    """Run a command that changes auction state. Only the leader worker does;
+    followers send theirs to it over the backplane"""
+    # Storage that failed a write can't make bids durable: no more are taken
+    # until a restart recovers from what is on disk
+    if storage.failed is not None:
+        raise storage.failed
+    key = command.get("idempotency_key")
+    if key is None:
+        return await run_command(command)
+    fingerprint = json.dumps({name: value for name, value in command.items() if name != "idempotency_key"},
+                             sort_keys=True)
+    try:
+        return await idempotency.run(key, fingerprint, lambda: run_command(command))
+    except IdempotencyConflict:
+        return "Error: Idempotency-Key was already used for a different request"
+
+async def run_command(command: dict):
+    command_type = command["type"]
+    if command_type == "bid_batch":
+        return await commit_bids(command["bids"])
+    product = find_product(command["product_id"])
+    if not product:
+        return "Error: Product not found"
+    if command_type == "bid":
+        return await commit_bid(product, command["user"], command["amount"], command.get("expected_highest"))
+    if command_type == "proxy_bid":
+        return await commit_proxy_bid(product, command["user"], command["max_amount"])
+    raise ValueError(f"Unknown command {command_type!r}")
+
+async def submit(command: dict):
+    """Run a command here on the leader, or on the leader from a follower.
+    
+    The leader sends a command's events before its reply, so by the time a
+    follower gets the result its own copy of the auctions already shows it."""
+    if backplane.is_leader:
+        try:
+            return await execute(command)
+        except DurabilityError as exc:
+            raise HTTPException(status_code=503, detail=f"Error: Bid could not be recorded ({exc})")
+    try:
+        return await backplane.request(command)
+    except BackplaneError as exc:
+        raise HTTPException(status_code=503, detail=f"Error: {exc}")
+
+# Admission control on the bid path: token buckets per user and per client
+# address, and a cap on bids in flight (waiting on the fsync or the leader).
+# Anything over the limits is turned away at once with 429, never queued.
+user_buckets = TokenBuckets(float(os.environ.get("BID_RATE_PER_USER", "5")),
+                            float(os.environ.get("BID_BURST_PER_USER", "10")))
+client_buckets = TokenBuckets(float(os.environ.get("BID_RATE_PER_CLIENT", "50")),
+                              float(os.environ.get("BID_BURST_PER_CLIENT", "100")))
+batch_client_buckets = TokenBuckets(float(os.environ.get("BID_RATE_PER_BATCH_CLIENT", "500")),
+                                    BATCH_BURST_PER_CLIENT)
+bids_in_flight = ConcurrencyLimit(int(os.environ.get("MAX_BIDS_IN_FLIGHT", "1000")))
+
+def too_many(message: str, retry_after: float) -> HTTPException:
+    return HTTPException(status_code=429, detail=message,
+                         headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+async def submit_bids(command: dict, client: Optional[str], users: Dict[str, int],
+                      clients: TokenBuckets = client_buckets):
+    """submit() for bids from ``client``, ``users[user]`` of them per user, once admitted"""
+    # Every bucket is checked before any is charged, so a rejected request costs nothing
+    charges = [(user_buckets, user, count, "user") for user, count in users.items()]
+    if client is not None:
+        charges.append((clients, client, sum(users.values()), "client"))
+    for buckets, key, cost, owner in charges:
+        if cost > buckets.burst:
+            raise HTTPException(status_code=400,
+                                detail=f"Error: At most {int(buckets.burst)} bids per {owner} in one request")
+    now = time.monotonic()
+    wait = max(buckets.wait(key, cost, now) for buckets, key, cost, _ in charges)
+    if wait:
+        raise too_many("Error: Too many bids, please slow down", wait)
+    if not bids_in_flight.try_acquire():
+        raise too_many("Error: Server is busy, please retry shortly", 1)
+    try:
+        for buckets, key, cost, _ in charges:
+            buckets.take(key, cost, now)
+        return await submit(command)
+    finally:
+        bids_in_flight.release()
+
+def client_of(connection) -> Optional[str]:
+    return connection.client.host if connection.client else None
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+def checked_key(idempotency_key: Optional[str]) -> Optional[str]:
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400,
+                            detail=f"Error: Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+    return idempotency_key
 
 @app.post("/api/bids", status_code=201)
-async def place_bid(bid: BidRequest):
-    """Place a new bid on a product"""
-    product = manager.agent._find_product(bid.product_id)
+@timed("/api/bids", 201)
+async def place_bid(bid: BidRequest, request: Request, idempotency_key: Optional[str] = Header(None)):
+    """Place a new bid on a product; a retry with the same Idempotency-Key gets the first outcome"""
+    product = find_product(bid.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    result = manager.agent.place_bid(bid.product_id, bid.amount, bid.user)
+    result = await submit_bids({
+        "type": "bid",
+        "product_id": product.id,
+        "user": bid.user,
+        "amount": bid.amount,
+        "expected_highest": bid.expected_highest,
+        "idempotency_key": checked_key(idempotency_key)
+    }, client_of(request), {bid.user: 1})
     
     if result.startswith("Error"):
         raise HTTPException(status_code=400, detail=result)
     
-    # Broadcast the new bid to all connected clients
-    await manager.broadcast({
-        "type": "bid_placed",
-        "product_id": bid.product_id,
-        "user": bid.user,
-        "amount": bid.amount,
-        "message": result
-    })
-    
     return {"status": "success", "message": result}
 
+@app.post("/api/bids/proxy", status_code=201)
+@timed("/api/bids/proxy", 201)
+async def place_proxy_bid(proxy: ProxyBidRequest, request: Request):
+    """Register a maximum bid that the server raises automatically, $1 at a time"""
+    product = find_product(proxy.product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    result = await submit_bids({
+        "type": "proxy_bid",
+        "product_id": product.id,
+        "user": proxy.user,
+        "max_amount": proxy.max_amount
+    }, client_of(request), {proxy.user: 1})
+    
+    if result.startswith("Error"):
+        raise HTTPException(status_code=400, detail=result)
+    
+    return {
+        "status": "success",
+        "message": result,
+        "current_highest_bid": product.current_highest_bid,
+        "leading": product.winner() == proxy.user
+    }
+
+@app.post("/api/bids/batch")
+@timed("/api/bids/batch")
+async def place_bids(batch: BidBatchRequest, request: Request, idempotency_key: Optional[str] = Header(None)):
+    """Place an ordered batch of bids, returning a result per bid"""
+    result = await submit_bids({
+        "type": "bid_batch",
+        "bids": [
+            {"product_id": bid.product_id, "user": bid.user, "amount": bid.amount,
+             "expected_highest": bid.expected_highest}
+            for bid in batch.bids
+        ],
+        "idempotency_key": checked_key(idempotency_key)
+    }, client_of(request), Counter(bid.user for bid in batch.bids), batch_client_buckets)
+    
+    if isinstance(result, str):
+        raise HTTPException(status_code=400, detail=result)
+    
+    return result
+
+@app.get("/metrics")
+async def get_metrics():
+    """This worker's metrics in the Prometheus text exposition format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# A worker stops reporting ready while its event loop is this far behind, or
+# (if set) while it holds this many WebSocket connections
+READY_MAX_LOOP_LAG = float(os.environ.get("READY_MAX_LOOP_LAG_MS", "250")) / 1000
+READY_MAX_CONNECTIONS = int(os.environ.get("READY_MAX_CONNECTIONS", "0"))
+
+@app.get("/health")
+async def health():
+    """Liveness: the worker is up and its event loop answers"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 while this worker should take traffic, 503 with the failing checks otherwise"""
+    lag = loop_lag.lag
+    connections = manager.connection_count()
+    checks = {
+        "storage_recovered": storage_recovered,
+        "storage_writable": storage.failed is None,
+        "leader_reachable": backplane.connected,
+        "loop_lag": lag <= READY_MAX_LOOP_LAG,
+        "connections": READY_MAX_CONNECTIONS <= 0 or connections < READY_MAX_CONNECTIONS,
+    }
+    is_ready = all(checks.values())
+    return FastJSONResponse({
+        "status": "ready" if is_ready else "unavailable",
+        "checks": checks,
+        "loop_lag_ms": round(lag * 1000, 1),
+        "connections": connections,
+        "bids_in_flight": bids_in_flight.active,
+        "leader": backplane.is_leader
+    }, status_code=200 if is_ready else 503)
+
 # WebSocket endpoint
+# Bids placed over sockets that are still waiting to become durable
+ws_bid_tasks: Set[asyncio.Task] = set()
+
+async def place_ws_bid(subscriber: Subscriber, command: dict):
+    """place_bid over the socket: the same path as POST /api/bids, answered with an ack or error"""
+    request_id = command.get("request_id")
+    retry_after = None
+    product = find_product(str(command.get("product_id", "")))
+    user = command.get("user") or command.get("user_id")
+    try:
+        amount = float(command["amount"])
+        if not math.isfinite(amount):
+            raise ValueError(amount)
+        expected_highest = command.get("expected_highest")
+        expected_highest = None if expected_highest is None else float(expected_highest)
+    except (KeyError, TypeError, ValueError):
+        product, result = None, "Error: A numeric amount is required"
+    else:
+        if not product:
+            result = "Error: Product not found"
+        elif not user:
+            result = "Error: A user is required"
+        elif len(str(user)) > MAX_USER_LENGTH:
+            result = f"Error: User names are at most {MAX_USER_LENGTH} characters"
+        else:
+            try:
+                result = await submit_bids({
+                    "type": "bid",
+                    "product_id": product.id,
+                    "user": str(user),
+                    "amount": amount,
+                    "expected_highest": expected_highest
+                }, client_of(subscriber.websocket), {str(user): 1})
+            except HTTPException as exc:
+                result = exc.detail
+                if exc.headers and "Retry-After" in exc.headers:
+                    retry_after = int(exc.headers["Retry-After"])
+            except Exception:
+                logger.exception("Failed to commit WebSocket bid")
+                result = "Error: Bid could not be recorded"
+    
+    if result.startswith("Error"):
+        reply = {"type": "error", "request_id": request_id, "message": result}
+        if retry_after is not None:
+            reply["retry_after"] = retry_after
+    else:
+        reply = {
+            "type": "ack",
+            "request_id": request_id,
+            "product_id": product.id,
+            "message": result,
+            "current_highest_bid": product.current_highest_bid
+        }
+    subscriber.send(Frame(reply))
+
+async def handle_command(subscriber: Subscriber, command: dict):
+    command_type = command.get("type")
+    if command_type in ("subscribe", "unsubscribe"):
+        product_ids = [str(product_id) for product_id in command.get("product_ids", [])]
+        fanout = manager.fanout_of(subscriber)
+        if command_type == "subscribe":
+            fanout.subscribe(subscriber, product_ids)
+        else:
+            fanout.unsubscribe(subscriber, product_ids)
+        subscriber.send(Frame({
+            "type": "subscribed",
+            "product_ids": None if subscriber.topics is None else sorted(subscriber.topics)
+        }))
+    elif command_type == "place_bid":
+        # Bids are placed in the order they arrive (tasks start in creation
+        # order); only the wait for durability overlaps with reading the next
+        # command, so acks can come back out of order and carry request_id
+        task = asyncio.create_task(place_ws_bid(subscriber, command))
+        ws_bid_tasks.add(task)
+        task.add_done_callback(ws_bid_tasks.discard)
+    else:
+        subscriber.send(Frame({
+            "type": "error",
+            "request_id": command.get("request_id"),
+            "message": f"Error: Unknown command {command_type!r}"
+        }))
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None, epoch: Optional[str] = None,
+                             products: Optional[str] = None, stream: Optional[str] = None):
+    # Reconnecting clients pass the last seq (and epoch) they saw to get only what
+    # they missed; ?products=1,2 starts the connection subscribed to those products
+    # and ?stream=raw opts out of conflation to see every single bid. Clients that
+    # offer the omni.msgpack.v1 subprotocol get binary MessagePack frames, and
+    # may send their commands that way too; everyone else gets JSON text
+    topics = set(filter(None, products.split(","))) if products is not None else None
+    protocol = negotiate(websocket.scope.get("subprotocols", []))
+    subscriber = await manager.connect(websocket, since, epoch, topics, raw=stream == "raw", protocol=protocol)
     try:
         while True:
-            data = await websocket.receive_text()
-            # Echo back the received message
-            await websocket.send_text(f"Message text was: {data}")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            data = message.get("text")
+            try:
+                command = loads(data if data is not None else message.get("bytes") or b"")
+            except (ValueError, TypeError):
+                command = None
+            if isinstance(command, dict):
+                await handle_command(subscriber, command)
+            elif data is not None:
+                # Echo back anything that isn't a command; replies go through the send queue too
+                subscriber.send(f"Message text was: {data}")
+            else:
+                subscriber.send(Frame({"type": "error", "message": "Error: Could not decode binary message"}))
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        manager.disconnect(subscriber)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
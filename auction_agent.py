@@ -1,7 +1,33 @@
+import itertools
+import logging
 import time
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from bid_engine import BidEngine
+from bid_history import BidHistory
+from product_index import ProductIndex
+from proxy_bidding import ProxyBook
+from search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+# (user, amount, result message) of a bid a proxy placed on someone's behalf
+ProxyBid = Tuple[str, float, str]
+
+# One clock for every version in the process, so a version number is never
+# reused, not even by a product rebuilt from storage
+_versions = itertools.count(1)
+
+def next_version() -> int:
+    return next(_versions)
+
+def format_remaining(seconds: float) -> str:
+    if seconds <= 0:
+        return "Auction has ended"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds}s remaining"
 
 @dataclass
 class Bid:
@@ -16,66 +42,204 @@ class Product:
     description: str
     current_highest_bid: float = 0.0
     auction_end_time: datetime = field(default_factory=lambda: datetime.now() + timedelta(minutes=10))
-    bidding_history: List[Bid] = field(default_factory=list)
+    bidding_history: BidHistory = field(default_factory=BidHistory)
+    closed: bool = False
+    # Changes whenever anything a client sees of this product does
+    version: int = field(default_factory=next_version, compare=False)
     
-    def time_remaining(self) -> str:
-        remaining = self.auction_end_time - datetime.now()
-        if remaining.total_seconds() <= 0:
+    def time_remaining(self, now: Optional[float] = None) -> str:
+        """Countdown text; pass ``now`` (epoch seconds) to share one clock read across products"""
+        if self.closed:
             return "Auction has ended"
-        minutes, seconds = divmod(int(remaining.total_seconds()), 60)
-        return f"{minutes}m {seconds}s remaining"
+        return format_remaining(self.auction_end_time.timestamp() - (time.time() if now is None else now))
+    
+    def has_ended(self) -> bool:
+        return self.closed or datetime.now() > self.auction_end_time
     
     def place_bid(self, user: str, amount: float) -> str:
-        if datetime.now() > self.auction_end_time:
+        if self.has_ended():
             return "Error: Auction has already ended"
             
         if amount <= self.current_highest_bid:
             return f"Error: Bid must be higher than current highest bid (${self.current_highest_bid})"
             
         self.current_highest_bid = amount
-        bid = Bid(user=user, amount=amount)
-        self.bidding_history.append(bid)
+        self.bidding_history.add(user, amount)
+        self.version = next_version()
         return f"Success! Your bid of ${amount:.2f} on {self.name} has been placed."
+    
+    def restore_bid(self, user: str, amount: float, timestamp_ms: int) -> None:
+        """Re-apply an already accepted bid (storage replay), skipping validation"""
+        if amount > self.current_highest_bid:
+            self.current_highest_bid = amount
+        self.bidding_history.add(user, amount, timestamp_ms)
+        self.version = next_version()
+    
+    def close(self) -> None:
+        self.closed = True
+        self.version = next_version()
+    
+    def winner(self) -> Optional[str]:
+        if not self.bidding_history:
+            return None
+        return self.bidding_history[-1].user
+
+def default_products() -> Dict[str, Product]:
+    return {
+        "iphone": Product(
+            id="1",
+            name="iPhone 15 Pro",
+            description="Latest iPhone with A17 Pro chip and 48MP camera",
+            current_highest_bid=1000.0,
+            auction_end_time=datetime.now() + timedelta(minutes=15)
+        ),
+        "macbook": Product(
+            id="2",
+            name="MacBook Pro 16",
+            description="M2 Max chip with 12-core CPU and 38-core GPU",
+            current_highest_bid=2000.0,
+            auction_end_time=datetime.now() + timedelta(minutes=30)
+        ),
+        "airpods": Product(
+            id="3",
+            name="AirPods Pro",
+            description="Wireless earbuds with active noise cancellation",
+            current_highest_bid=500.0,
+            auction_end_time=datetime.now() + timedelta(minutes=20)
+        ),
+        "google_pixel_7": Product(
+            id="4",
+            name="Google Pixel 7",
+            description="Latest Google Pixel with 50MP camera and 120Hz display",
+            current_highest_bid=1500.0,
+            auction_end_time=datetime.now() + timedelta(minutes=10)
+        ),
+        "RTX 5090": Product(
+            id="5",
+            name="RTX 5090",
+            description="Latest NVIDIA RTX 5090 with 24GB GDDR6X memory",
+            current_highest_bid=3000.0,
+            auction_end_time=datetime.now() + timedelta(minutes=10)
+        )
+    }
 
 class AuctionAgent:
-    def __init__(self):
-        self.products: Dict[str, Product] = {
-            "iphone": Product(
-                id="1",
-                name="iPhone 15 Pro",
-                description="Latest iPhone with A17 Pro chip and 48MP camera",
-                current_highest_bid=1000.0,
-                auction_end_time=datetime.now() + timedelta(minutes=15)
-            ),
-            "macbook": Product(
-                id="2",
-                name="MacBook Pro 16",
-                description="M2 Max chip with 12-core CPU and 38-core GPU",
-                current_highest_bid=2000.0,
-                auction_end_time=datetime.now() + timedelta(minutes=30)
-            ),
-            "airpods": Product(
-                id="3",
-                name="AirPods Pro",
-                description="Wireless earbuds with active noise cancellation",
-                current_highest_bid=500.0,
-                auction_end_time=datetime.now() + timedelta(minutes=20)
-            ),
-            "google_pixel_7": Product(
-                id="4",
-                name="Google Pixel 7",
-                description="Latest Google Pixel with 50MP camera and 120Hz display",
-                current_highest_bid=1500.0,
-                auction_end_time=datetime.now() + timedelta(minutes=10)
-            ),
-            "RTX 5090": Product(
-                id="5",
-                name="RTX 5090",
-                description="Latest NVIDIA RTX 5090 with 24GB GDDR6X memory",
-                current_highest_bid=3000.0,
-                auction_end_time=datetime.now() + timedelta(minutes=10)
-            )
-        }
+    def __init__(self, storage=None):
+        self.products: Dict[str, Product] = {}
+        self.engine = BidEngine()
+        self.index = ProductIndex()
+        self.search = SearchIndex()
+        self.proxies: Dict[str, ProxyBook] = {}
+        self.storage = None
+        # Changes whenever any product is added or changes
+        self.version = next_version()
+        if storage is None:
+            for key, product in default_products().items():
+                self.add_product(key, product)
+        else:
+            self.load(storage)
+    
+    def load(self, storage, persist: bool = True,
+             catalog: Optional[Iterable[Tuple[str, Product]]] = None) -> int:
+        """Rebuild the catalog and bid history from a storage backend and persist
+        through it from now on. Returns the number of bids restored.
+        
+        ``catalog`` (key, product) pairs whose ids storage doesn't have yet are
+        added before any bids are replayed, so bids on them aren't lost. With
+        ``persist`` False the storage is only read, for a replica that another
+        process writes through."""
+        self.products = {}
+        self.index = ProductIndex()
+        self.search = SearchIndex()
+        self.storage = self.engine.storage = None
+        for record in storage.load_products():
+            record = dict(record)
+            self.add_product(record.pop("key"), Product(**record))
+        if not self.products:
+            for key, product in default_products().items():
+                self.add_product(key, product)
+                if persist:
+                    storage.save_product(key, product)
+        if catalog is not None:
+            self.storage = storage if persist else None
+            self.add_products(catalog)
+            self.storage = None
+        
+        restored = 0
+        unknown = 0
+        get = self.index.get
+        for product_id, user, amount, timestamp_ms in storage.load_bids():
+            product = get(product_id)
+            if product is not None:
+                product.restore_bid(user, amount, timestamp_ms)
+                restored += 1
+            else:
+                unknown += 1
+        if unknown:
+            logger.warning("Skipped %d stored bids on products missing from the catalog", unknown)
+        if persist:
+            storage.start()
+            self.storage = self.engine.storage = storage
+        self.version = next_version()
+        return restored
+    
+    def add_product(self, key: str, product: Product) -> None:
+        self.products[key] = product
+        self.index.add(key, product)
+        if not product.closed:
+            self.search.add(product)
+        self.version = next_version()
+        if self.storage is not None:
+            self.storage.save_product(key, product)
+    
+    def add_products(self, products: Iterable[Tuple[str, Product]], batch_size: int = 10000) -> int:
+        """Bulk-add (key, product) pairs, skipping ids already in the catalog.
+        
+        Accepts any iterable (e.g. a streaming file reader) and persists in
+        batches, so large imports never build the whole catalog up front."""
+        added = 0
+        batch = []
+        for key, product in products:
+            if self.index.get(product.id) is not None:
+                continue
+            self.products[key] = product
+            self.index.add(key, product)
+            if not product.closed:
+                self.search.add(product)
+            added += 1
+            if self.storage is not None:
+                batch.append((key, product))
+                if len(batch) >= batch_size:
+                    self.storage.save_products(batch)
+                    batch = []
+        if batch:
+            self.storage.save_products(batch)
+        if added:
+            self.version = next_version()
+        return added
+    
+    def page_products(self, cursor: int = 0, limit: int = 100,
+                      predicate: Optional[Callable[[Product], bool]] = None,
+                      max_scan: Optional[int] = None) -> Tuple[List[Product], Optional[int]]:
+        """One page of the catalog in insertion order, starting at position ``cursor``.
+        
+        Returns the page and the cursor of the next one (None at the end). With a
+        ``predicate`` at most ``max_scan`` products are examined, so a selective
+        filter can return a short page rather than walk the whole catalog."""
+        ordered = self.index.ordered
+        if predicate is None:
+            end = min(len(ordered), cursor + limit)
+            return ordered[cursor:end], (end if end < len(ordered) else None)
+        
+        page = []
+        position = cursor
+        scan_end = min(len(ordered), cursor + (max_scan or limit * 20))
+        while position < scan_end and len(page) < limit:
+            product = ordered[position]
+            position += 1
+            if predicate(product):
+                page.append(product)
+        return page, (position if position < len(ordered) else None)
     
     def list_products(self) -> str:
         response = "Current Auction Items:\n"
@@ -94,19 +258,116 @@ class AuctionAgent:
             f"{product.time_remaining()}"
         )
     
-    def place_bid(self, product_name: str, amount: float, user: str = "User") -> str:
+    def place_bid(self, product_name: str, amount: float, user: str = "User",
+                  expected_highest: Optional[float] = None) -> str:
         product = self._find_product(product_name)
         if not product:
             return "Product not found. Please check the product name."
             
-        return product.place_bid(user, amount)
+        result, _ = self.submit_bid(product, user, amount, expected_highest)
+        return result
+    
+    def submit_bid(self, product: Product, user: str, amount: float,
+                   expected_highest: Optional[float] = None) -> Tuple[str, List[ProxyBid]]:
+        """Place a bid, then let registered proxies answer it.
+        
+        Returns the bid's result message and any counter-bids proxies placed."""
+        result = self.engine.place_bid(product, user, amount, expected_highest)
+        if not result.startswith("Success"):
+            return result, []
+        placed = self._settle_proxies(product) if product.id in self.proxies else []
+        self.version = next_version()
+        return result, placed
+    
+    def place_bids(self, bids: List[Tuple[str, float, str, Optional[float]]]) -> List[Tuple[Optional[Product], str, List[ProxyBid]]]:
+        """Apply (product_name, amount, user, expected_highest) bids in order.
+        
+        Returns one (product, result message, proxy counter-bids) triple per
+        bid; product is None when it could not be found."""
+        results = []
+        find = self._find_product
+        submit_bid = self.submit_bid
+        for product_name, amount, user, expected_highest in bids:
+            product = find(product_name)
+            if not product:
+                results.append((None, "Product not found. Please check the product name.", []))
+            else:
+                results.append((product, *submit_bid(product, user, amount, expected_highest)))
+        return results
+    
+    def register_proxy_bid(self, product: Product, user: str, max_amount: float) -> Tuple[str, List[ProxyBid]]:
+        """Let the engine bid for ``user`` up to ``max_amount``, in PROXY_INCREMENT steps"""
+        if product.has_ended():
+            return "Error: Auction has already ended", []
+        if max_amount <= product.current_highest_bid:
+            return f"Error: Maximum bid must be higher than current highest bid (${product.current_highest_bid})", []
+        
+        book = self.proxies.get(product.id)
+        if book is None:
+            book = self.proxies[product.id] = ProxyBook()
+        book.register(user, max_amount)
+        placed = self._settle_proxies(product)
+        if placed:
+            self.version = next_version()
+        return f"Success! Proxy bid up to ${max_amount:.2f} on {product.name} has been registered.", placed
+    
+    def _settle_proxies(self, product: Product) -> List[ProxyBid]:
+        book = self.proxies[product.id]
+        placed = []
+        while True:
+            with self.engine.lock_for(product.id):
+                current = product.current_highest_bid
+                leader = product.winner()
+                bids = len(product.bidding_history)
+            counter = book.resolve(current, leader)
+            if counter is None:
+                return placed
+            user, amount = counter
+            # Compare-and-set: if a live bid slipped in, resolve again against it
+            result = self.engine.place_bid(product, user, amount, expected_highest=current)
+            if result.startswith("Success"):
+                placed.append((user, amount, result))
+            elif not result.startswith("Error: Current highest bid changed"):
+                return placed
+            elif len(product.bidding_history) == bids:
+                # The check failed without any bid landing (a price that never
+                # compares equal, like NaN); retrying would spin forever
+                return placed
+    
+    def capture_snapshot(self):
+        """Consistent copy of all product state for storage.write_snapshot"""
+        with self.engine.all_locks():
+            return self.storage.capture_snapshot(self.products)
+    
+    def close_auction(self, product: Product) -> bool:
+        """Freeze a product's auction; returns False if it was already closed"""
+        with self.engine.lock_for(product.id):
+            if product.closed:
+                return False
+            product.close()
+        if self.storage is not None:
+            # Or a restart would close it, and announce it, all over again
+            self.storage.save_closed(product.id)
+        self.proxies.pop(product.id, None)
+        self.search.remove(product)
+        self.version = next_version()
+        return True
+    
+    def mirror_bid(self, product: Product, user: str, amount: float, timestamp_ms: int) -> bool:
+        """Apply a bid another process already accepted; False if this copy has it"""
+        # Bids only go up, so one already loaded from storage is never higher
+        if amount <= product.current_highest_bid:
+            return False
+        product.restore_bid(user, amount, timestamp_ms)
+        self.version = next_version()
+        return True
+    
+    def search_products(self, query: str, limit: int = 10) -> List[Tuple[Product, float]]:
+        """Live auctions matching every word of ``query`` (the last as a prefix), best first"""
+        return [(product, score) for product, score in self.search.search(query, limit) if not product.has_ended()]
     
     def _find_product(self, product_name: str) -> Optional[Product]:
-        product_name = product_name.lower()
-        for key, product in self.products.items():
-            if product_name in key or product_name in product.name.lower():
-                return product
-        return None
+        return self.index.find(product_name)
 
 def main():
     agent = AuctionAgent()
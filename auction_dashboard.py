@@ -10,9 +10,12 @@ import pandas as pd
 from streamlit_autorefresh import st_autorefresh
 import threading
 from queue import Queue
+from urllib.parse import urlencode
+import uuid
 import json
 import os
 from omnidimension import Client
+from ws_protocol import loads, protocols
 
 # Initialize OmniDimension client
 try:
@@ -67,11 +70,39 @@ class WebSocketClient:
         self.connected = False
         self.should_stop = False
         self.thread = None
+        # Position in the server's event stream, so reconnects only replay what was missed
+        self.last_seq = None
+        self.epoch = None
+        # The product being viewed; the server only sends us its events
+        self.product_id = None
+        self.loop = None
+
+    def resume_uri(self):
+        params = {}
+        if self.last_seq is not None:
+            params.update(since=self.last_seq, epoch=self.epoch)
+        if self.product_id is not None:
+            params["products"] = self.product_id
+        return f"{self.uri}?{urlencode(params)}" if params else self.uri
+
+    def watch(self, product_id):
+        """Switch the subscription to the product selected in the UI"""
+        if product_id == self.product_id:
+            return
+        previous, self.product_id = self.product_id, product_id
+        if self.ws is None or not self.connected or self.loop is None:
+            return  # Picked up from resume_uri() on (re)connect
+        commands = [{"type": "subscribe", "product_ids": [product_id]}]
+        if previous is not None:
+            commands.append({"type": "unsubscribe", "product_ids": [previous]})
+        for command in commands:
+            asyncio.run_coroutine_threadsafe(self.ws.send(json.dumps(command)), self.loop)
 
     async def connect(self):
+        self.loop = asyncio.get_running_loop()
         while not self.should_stop:
             try:
-                async with websockets.connect(self.uri, ping_interval=None) as ws:
+                async with websockets.connect(self.resume_uri(), ping_interval=None, subprotocols=protocols()) as ws:
                     self.ws = ws
                     self.connected = True
                     st.rerun()  # Rerun to update connection status
@@ -80,10 +111,12 @@ class WebSocketClient:
                         if self.should_stop:
                             break
                         try:
-                            data = json.loads(message)
+                            data = loads(message)
+                            self.epoch = data.get('epoch', self.epoch)
+                            self.last_seq = data.get('seq', self.last_seq)
                             ws_messages.put(data)
                             st.rerun()  # Rerun to process new message
-                        except json.JSONDecodeError:
+                        except ValueError:
                             print(f"Failed to parse message: {message}")
                             
             except Exception as e:
@@ -192,30 +225,105 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Helper functions
+def time_left(ends_at):
+    """Countdown in the API's time_remaining format, from an absolute end time"""
+    remaining = int(ends_at - time.time())
+    if remaining <= 0:
+        return "Auction has ended"
+    minutes, seconds = divmod(remaining, 60)
+    return f"{minutes}m {seconds}s remaining"
+
+def get_json(url):
+    """GET with If-None-Match, reusing the copy from the last rerun on 304 Not Modified"""
+    cache = st.session_state.setdefault('http_cache', {})
+    cached = cache.get(url)
+    response = requests.get(url, headers={'If-None-Match': cached[0]} if cached else {})
+    if response.status_code == 304:
+        return cached[1]
+    response.raise_for_status()
+    data = response.json()
+    if 'ETag' in response.headers:
+        cache[url] = (response.headers['ETag'], data)
+    return data
+
+def with_time_left(product):
+    # A revalidated copy can be minutes old; only its countdown needs updating
+    if 'ends_at' in product:
+        product['time_remaining'] = time_left(product['ends_at'])
+    return product
+
 def fetch_products():
     try:
-        response = requests.get(f"{API_BASE_URL}/products")
-        response.raise_for_status()
-        return response.json()
+        return [with_time_left(product) for product in get_json(f"{API_BASE_URL}/products")]
     except Exception as e:
         st.error(f"Error fetching products: {str(e)}")
         return []
 
 def fetch_product_details(product_id):
     try:
-        response = requests.get(f"{API_BASE_URL}/products/{product_id}")
-        response.raise_for_status()
-        return response.json()
+        return with_time_left(get_json(f"{API_BASE_URL}/products/{product_id}"))
     except Exception as e:
         st.error(f"Error fetching product details: {str(e)}")
         return None
 
-def place_bid(product_id, user, amount, voice_call=False):
+def fetch_bid_history(product_id, cursor, limit=100):
+    """One page of bids from before ``cursor``, oldest first, and the cursor for the page before it"""
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/bids",
-            json={"product_id": product_id, "user": user, "amount": amount, "voice_call": voice_call}
+        page = get_json(
+            f"{API_BASE_URL}/products/{product_id}?"
+            + urlencode({"fields": "bidding_history,history_cursor", "history_cursor": cursor, "history_limit": limit})
         )
+        return page['bidding_history'], page['history_cursor']
+    except Exception as e:
+        st.error(f"Error fetching bid history: {str(e)}")
+        return [], cursor
+
+def bidding_history(product):
+    """The product's latest bids plus any older pages loaded with "Load older bids".
+    
+    Older pages are kept in session state by bid position; positions never
+    change, so bids that arrived since only have to be fetched for the gap
+    between the loaded pages and the latest page."""
+    newest_start = product.get('history_cursor')
+    older = st.session_state.setdefault('older_bids', {}).get(product['id'])
+    if older and newest_start is not None and newest_start > older['end']:
+        gap = newest_start - older['end']
+        if gap > 1000:
+            # Too far behind to patch up; start over from the latest page
+            del st.session_state['older_bids'][product['id']]
+            older = None
+        else:
+            rows, _ = fetch_bid_history(product['id'], newest_start, gap)
+            older['rows'] += rows
+            older['end'] = newest_start
+    rows = (older['rows'] if older else []) + product['bidding_history']
+    cursor = older['cursor'] if older else newest_start
+    return rows, cursor
+
+def post_bid(payload, attempts=3, timeout=5):
+    """POST a bid, retrying timeouts, dropped connections and 429/503 under one
+    Idempotency-Key, so the server applies it at most once"""
+    key = uuid.uuid4().hex
+    for attempt in range(attempts):
+        try:
+            response = requests.post(
+                f"{API_BASE_URL}/bids",
+                json=payload,
+                headers={'Idempotency-Key': key},
+                timeout=timeout
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+            continue
+        if response.status_code not in (429, 503) or attempt == attempts - 1:
+            return response
+        time.sleep(float(response.headers.get('Retry-After', 0.5 * 2 ** attempt)))
+
+def place_bid(product_id, user, amount, voice_call=False):
+    try:
+        response = post_bid({"product_id": product_id, "user": user, "amount": amount, "voice_call": voice_call})
         response.raise_for_status()
         
         # Show a success toast
@@ -461,6 +569,10 @@ def process_ws_messages():
             message = ws_messages.get()
             if message.get('type') == 'bid_placed':
                 st.toast(f"🚀 New bid: ${message['amount']} on {message.get('product_id', 'an item')} by {message.get('user', 'Someone')}")
+            elif message.get('type') == 'bid_batch':
+                st.toast(f"🚀 {len(message.get('bids', []))} new bids placed")
+            elif message.get('type') == 'auction_ended':
+                st.toast(f"🏁 Auction ended: {message.get('name', 'an item')} sold for ${message.get('final_bid', 0):,.2f}")
             ws_messages.task_done()
     except Exception as e:
         st.warning(f"⚠️ Error processing WebSocket messages: {str(e)}")
@@ -533,6 +645,8 @@ def main():
             format_func=lambda x: next((p['name'] for p in products if p['id'] == x), ""),
             key="product_selector"
         )
+        if st.session_state.get('ws_client'):
+            st.session_state.ws_client.watch(selected_product_id)
         
         # Voice call section
         if omnidim_client:
@@ -635,9 +749,18 @@ def main():
             # Create a container for the history that we can update
             history_container = st.container()
             
-            if product['bidding_history']:
+            history, older_cursor = bidding_history(product)
+            if older_cursor is not None and st.button("Load older bids"):
+                rows, next_cursor = fetch_bid_history(selected_product_id, older_cursor)
+                older = st.session_state['older_bids'].setdefault(
+                    selected_product_id, {'rows': [], 'end': older_cursor})
+                older['rows'] = rows + older['rows']
+                older['cursor'] = next_cursor
+                history = rows + history
+            
+            if history:
                 # Convert to DataFrame for better display
-                history_df = pd.DataFrame(product['bidding_history'])
+                history_df = pd.DataFrame(history)
                 history_df['timestamp'] = pd.to_datetime(history_df['timestamp'])
                 
                 # Add a visual indicator for the latest bid
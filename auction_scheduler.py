@@ -0,0 +1,71 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AuctionScheduler:
+    """Closes auctions at their ``auction_end_time`` from a single timer heap.
+
+    One background task sleeps until the earliest deadline, so pending
+    auctions cost a heap entry each instead of a periodic scan. Entries whose
+    product was closed or given a new end time since they were pushed are
+    skipped when they surface (lazy deletion); re-``schedule`` after changing
+    an end time.
+    """
+
+    def __init__(self, on_close: Callable[[object], Awaitable[None]]):
+        self._on_close = on_close
+        self._heap: List[Tuple[float, int, object]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, product) -> None:
+        deadline = product.auction_end_time.timestamp()
+        heapq.heappush(self._heap, (deadline, next(self._counter), product))
+        if self._heap[0][2] is product:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            deadline, _, product = heapq.heappop(self._heap)
+            if product.closed or product.auction_end_time.timestamp() != deadline:
+                continue
+            try:
+                await self._on_close(product)
+            except Exception:
+                logger.exception("Failed to close auction for product %s", product.id)
@@ -0,0 +1,264 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# A follower whose unsent events pass this many bytes is dropped; it rejoins
+# and catches up from the leader's event log (or rebuilds from storage)
+MAX_FOLLOWER_BACKLOG = 64 * 1024 * 1024
+# Longest line either side will read, so a large bid_batch fits
+MAX_LINE = 16 * 1024 * 1024
+RECONNECT_DELAY = 0.5
+
+Execute = Callable[[dict], Awaitable[Any]]
+
+
+class BackplaneError(Exception):
+    """A command could not be run on the leader"""
+
+
+class Backplane:
+    """How API worker processes share one authoritative auction.
+
+    Exactly one worker is the leader: it owns storage, places every bid and
+    sequences every event, and ``publish`` hands each event on to the other
+    workers. Followers keep their own copy of the auctions, mirrored from
+    that event stream, to serve reads and WebSocket clients locally, and
+    pass every command that changes state to the leader with ``request``.
+
+    This base class is the single-process case: always the leader, with no
+    one to publish to.
+    """
+
+    is_leader = True
+
+    @property
+    def connected(self) -> bool:
+        """Whether commands can reach the leader right now"""
+        return True
+
+    async def start(self) -> None:
+        """Decide this worker's role"""
+
+    async def serve(self, execute: Execute, events) -> None:
+        """Leader: start taking followers, running their commands with ``execute``"""
+
+    async def follow(self, events, on_hello: Callable[[dict], None], on_event: Callable[[dict], None]) -> None:
+        """Follower: join the leader's stream; returns once the first ``on_hello`` ran"""
+        raise NotImplementedError
+
+    def publish(self, text: str) -> None:
+        """Leader: send one serialized event to every follower"""
+
+    async def request(self, command: dict) -> Any:
+        """Follower: run ``command`` on the leader and return its result"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class UnixBackplane(Backplane):
+    """Workers on one machine, joined through a Unix domain socket at ``path``.
+
+    Whoever takes the ``path + ".lock"`` file lock first is the leader and
+    listens on the socket; everyone else connects to it. Messages are JSON,
+    one per line. A follower joins with the seq and epoch it last saw and is
+    answered with a ``hello`` that says whether the leader could replay
+    everything since then; if not, the follower rebuilds its copy from
+    storage (every event is durable before it is published) before taking
+    the live stream. Followers whose leader goes away keep reconnecting, so
+    a leader restarted by the process manager picks them back up.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_leader = False
+        self._lock_file = None
+        # Leader side
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._followers: Set[asyncio.StreamWriter] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        # Follower side
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.is_leader or self._writer is not None
+
+    async def start(self) -> None:
+        self._lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        self.is_leader = True
+
+    # Leader
+
+    async def serve(self, execute: Execute, events) -> None:
+        # The lock guarantees nobody else is listening, so the socket file is stale
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                await self._lead(reader, writer, execute, events)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            except Exception:
+                logger.exception("Backplane follower connection failed")
+            finally:
+                self._followers.discard(writer)
+                writer.close()
+
+        self._server = await asyncio.start_unix_server(handle, self.path, limit=MAX_LINE)
+        logger.info("Leading workers on %s", self.path)
+
+    async def _lead(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    execute: Execute, events) -> None:
+        join = json.loads(await reader.readline() or b"null")
+        if not isinstance(join, dict) or join.get("op") != "join":
+            return
+        # No await from here until the follower is registered, so no event can
+        # fall between the replay and the live stream
+        since = join.get("since")
+        missed = None if since is None else events.since(since, join.get("epoch"))
+        writer.write(json.dumps({
+            "op": "hello", "epoch": events.epoch, "seq": events.seq, "resync": missed is None
+        }).encode() + b"\n")
+        for event in missed or ():
+            writer.write(b'{"op": "event", "event": ' + json.dumps(event).encode() + b"}\n")
+        self._followers.add(writer)
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            if message.get("op") == "request":
+                # Started in arrival order, so a follower's commands are applied in
+                # the order it sent them; only the replies can overtake each other
+                task = asyncio.create_task(self._reply(writer, message, execute))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _reply(self, writer: asyncio.StreamWriter, message: dict, execute: Execute) -> None:
+        try:
+            reply = {"op": "reply", "id": message["id"], "result": await execute(message["command"])}
+        except Exception as exc:
+            logger.exception("Failed to run command from follower")
+            reply = {"op": "reply", "id": message["id"], "error": str(exc) or type(exc).__name__}
+        # Any events the command produced were written to this follower first
+        if not writer.is_closing():
+            writer.write(json.dumps(reply).encode() + b"\n")
+
+    def publish(self, text: str) -> None:
+        if not self._followers:
+            return
+        line = b'{"op": "event", "event": ' + text.encode() + b"}\n"
+        dropped = []
+        for writer in self._followers:
+            if writer.transport.get_write_buffer_size() > MAX_FOLLOWER_BACKLOG:
+                dropped.append(writer)
+            else:
+                writer.write(line)
+        for writer in dropped:
+            logger.warning("Dropping a follower that stopped reading the event stream")
+            self._followers.discard(writer)
+            writer.close()
+
+    # Follower
+
+    async def follow(self, events, on_hello: Callable[[dict], None], on_event: Callable[[dict], None]) -> None:
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._follow(events, on_hello, on_event, ready))
+        await ready
+
+    async def _follow(self, events, on_hello: Callable[[dict], None], on_event: Callable[[dict], None],
+                      ready: asyncio.Future) -> None:
+        joined = False
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE)
+            except (ConnectionError, FileNotFoundError):
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                writer.write(json.dumps({
+                    "op": "join",
+                    "since": events.seq if joined else None,
+                    "epoch": events.epoch if joined else None,
+                }).encode() + b"\n")
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    message = json.loads(line)
+                    op = message.get("op")
+                    if op == "event":
+                        on_event(message["event"])
+                    elif op == "reply":
+                        future = self._pending.pop(message["id"], None)
+                        if future is not None and not future.done():
+                            if "error" in message:
+                                future.set_exception(BackplaneError(message["error"]))
+                            else:
+                                future.set_result(message["result"])
+                    elif op == "hello":
+                        on_hello(message)
+                        joined = True
+                        self._writer = writer
+                        if not ready.done():
+                            ready.set_result(None)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            except Exception:
+                logger.exception("Backplane stream from the leader failed")
+            finally:
+                self._writer = None
+                writer.close()
+                # The leader is gone, and with it any command still waiting on it
+                pending, self._pending = self._pending, {}
+                for future in pending.values():
+                    if not future.done():
+                        future.set_exception(BackplaneError("Lost connection to the leader worker"))
+            logger.warning("Lost the leader worker on %s; reconnecting", self.path)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def request(self, command: dict) -> Any:
+        if self._writer is None:
+            raise BackplaneError("Leader worker unavailable")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(json.dumps({"op": "request", "id": request_id, "command": command}).encode() + b"\n")
+        return await future
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in self._followers:
+                writer.close()
+            self._followers.clear()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -0,0 +1,70 @@
+"""Compare memory and access cost of List[Bid] against the columnar BidHistory.
+
+    python benchmarks/bench_bid_history.py [bids]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auction_agent import Bid
+from bid_history import BidHistory
+
+USERS = [f"bidder-{i}" for i in range(1000)]
+
+
+def build_list(n: int):
+    start = datetime.now()
+    return [Bid(user=USERS[i % len(USERS)], amount=1000.0 + i, timestamp=start + timedelta(milliseconds=i))
+            for i in range(n)]
+
+
+def build_columnar(n: int):
+    start_ms = int(datetime.now().timestamp() * 1000)
+    history = BidHistory()
+    for i in range(n):
+        history.add(USERS[i % len(USERS)], 1000.0 + i, start_ms + i)
+    return history
+
+
+def measure(label: str, build, n: int):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    history = build(n)
+    build_time = time.perf_counter() - started
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(10000):
+        history[-10:]
+    tail_time = (time.perf_counter() - started) / 10000
+
+    started = time.perf_counter()
+    total = sum(bid.amount for bid in history)
+    scan_time = time.perf_counter() - started
+
+    print(f"{label:<12} {size / 2**20:>9.1f} MiB {size / n:>8.1f} B/bid "
+          f"build {build_time:>6.2f}s  tail[-10:] {tail_time * 1e6:>6.1f}us  full scan {scan_time:>6.2f}s")
+    assert total > 0
+    return size
+
+
+def main(n: int = 1_000_000):
+    print(f"{n:,} bids, {len(USERS)} distinct users")
+    list_size = measure("List[Bid]", build_list, n)
+    columnar_size = measure("BidHistory", build_columnar, n)
+    history = build_columnar(n)
+    started = time.perf_counter()
+    sum(history.amounts)
+    print(f"BidHistory column scan (sum of amounts): {(time.perf_counter() - started) * 1e3:.1f}ms")
+    print(f"BidHistory uses {list_size / columnar_size:.1f}x less memory")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
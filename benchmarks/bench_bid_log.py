@@ -0,0 +1,73 @@
+"""Measure group-committed bid throughput and crash-recovery time of the bid log.
+
+    python benchmarks/bench_bid_log.py [recovery_entries] [writer_threads]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auction_agent import AuctionAgent
+from bid_log import BidLog, encode_record
+from storage import MemoryStorage
+
+
+def durable_throughput(path: str, threads: int, seconds: float = 3.0):
+    """Each thread places a bid and blocks until it is fsynced, like an API request would"""
+    agent = AuctionAgent(MemoryStorage(BidLog(path)))
+    product_ids = [product.id for product in agent.products.values()]
+    stop = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def bidder(worker: int):
+        product_id = product_ids[worker % len(product_ids)]
+        while time.perf_counter() < stop:
+            product = agent.index.get(product_id)
+            if agent.place_bid(product_id, product.current_highest_bid + 1, f"user{worker}").startswith("Success"):
+                agent.storage.sync().result()
+                counts[worker] += 1
+
+    workers = [threading.Thread(target=bidder, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    agent.storage.close()
+    total = sum(counts)
+    print(f"durable bids: {total:,} in {seconds:.0f}s from {threads} threads ({total / seconds:,.0f} bids/s)")
+
+
+def recovery_time(path: str, entries: int):
+    agent = AuctionAgent()
+    product_ids = [product.id for product in agent.products.values()]
+    with open(path, "wb") as f:
+        chunk = []
+        base_ms = int(time.time() * 1000)
+        for i in range(entries):
+            chunk.append(encode_record(product_ids[i % len(product_ids)], f"user{i % 5000}", 5000.0 + i, base_ms + i))
+            if len(chunk) == 100_000:
+                f.write(b"".join(chunk))
+                chunk.clear()
+        f.write(b"".join(chunk))
+    size = os.path.getsize(path)
+
+    started = time.perf_counter()
+    restored = agent.load(MemoryStorage(BidLog(path)))
+    elapsed = time.perf_counter() - started
+    agent.storage.close()
+    assert restored == entries
+    print(f"recovery: {restored:,} bids ({size / 2**20:,.0f} MiB) replayed in {elapsed:.2f}s "
+          f"({restored / elapsed:,.0f} bids/s)")
+
+
+def main(entries: int = 10_000_000, threads: int = 64):
+    with tempfile.TemporaryDirectory() as tmp:
+        durable_throughput(os.path.join(tmp, "throughput.log"), threads)
+        recovery_time(os.path.join(tmp, "recovery.log"), entries)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
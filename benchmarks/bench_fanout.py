@@ -0,0 +1,85 @@
+"""Time fanning one bid out to many WebSocket subscribers, with some of them
+stalled, and then to the same number subscribed to individual products.
+
+    python benchmarks/bench_fanout.py [subscribers] [stalled]
+
+Sockets are in-process fakes, so this measures the server side only:
+serializing once, queueing per subscriber and the per-subscriber send tasks.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fanout import Fanout, Subscriber
+
+
+class FakeSocket:
+    def __init__(self, done: asyncio.Event, expected: list, stalled: bool = False):
+        self.done = done
+        self.expected = expected
+        self.stalled = stalled
+
+    async def send_text(self, text: str):
+        if self.stalled:
+            await asyncio.sleep(3600)
+        self.expected[0] -= 1
+        if self.expected[0] == 0:
+            self.done.set()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run(subscribers: int, stalled: int, queue_size: int = 64):
+    fanout = Fanout()
+    done = asyncio.Event()
+    remaining = [subscribers - stalled]
+    snapshot = lambda topics: {"type": "snapshot", "seq": 0, "products": []}
+    for i in range(subscribers):
+        fanout.add(Subscriber(FakeSocket(done, remaining, stalled=i < stalled), snapshot, queue_size))
+    await asyncio.sleep(0)
+
+    bid = {"type": "bid_placed", "seq": 1, "product_id": "1", "user": "alice", "amount": 1234.0, "message": "Success!"}
+    started = time.perf_counter()
+    fanout.publish(json.dumps(bid), bid["seq"])
+    queued = time.perf_counter() - started
+    await done.wait()
+    delivered = time.perf_counter() - started
+    print(f"{subscribers:,} subscribers ({stalled:,} stalled): queued in {queued * 1000:.1f} ms, "
+          f"delivered to all live ones in {delivered * 1000:.1f} ms")
+
+    # Stalled subscribers fill up, drop to a snapshot, then get evicted
+    for seq in range(2, queue_size * 2 + 4):
+        fanout.publish(json.dumps(dict(bid, seq=seq)), seq)
+        await asyncio.sleep(0)
+    print(f"after {queue_size * 2 + 2} more bids: {subscribers - len(fanout):,} stalled subscribers evicted")
+
+
+async def run_topics(subscribers: int, products: int = 5000):
+    """Every subscriber watches one product, so a bid only reaches that product's watchers"""
+    fanout = Fanout()
+    done = asyncio.Event()
+    remaining = [0]
+    snapshot = lambda topics: {"type": "snapshot", "seq": 0, "products": []}
+    for i in range(subscribers):
+        fanout.add(Subscriber(FakeSocket(done, remaining), snapshot, topics={str(i % products)}))
+    await asyncio.sleep(0)
+
+    remaining[0] = len(fanout.topics["1"])
+    bid = {"type": "bid_placed", "seq": 1, "product_id": "1", "user": "alice", "amount": 1234.0, "message": "Success!"}
+    started = time.perf_counter()
+    fanout.publish(json.dumps(bid), bid["seq"], {"1"})
+    await done.wait()
+    print(f"{subscribers:,} subscribers over {products:,} products: delivered to the {len(fanout.topics['1'])} "
+          f"watching product 1 in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    subscribers, stalled = args + [50_000, 100][len(args):]
+    asyncio.run(run(subscribers, stalled))
+    asyncio.run(run_topics(subscribers))
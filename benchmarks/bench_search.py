@@ -0,0 +1,94 @@
+"""Query latency of the product search index over a large synthetic catalog.
+
+    python benchmarks/bench_search.py [listings] [queries]
+
+Words are drawn from a Zipf-like distribution so the index sees both very
+common and rare tokens. Queries mix single words, multi-word names and
+partially typed (prefix) final words.
+"""
+import gc
+import os
+import random
+import string
+import sys
+import time
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex
+
+
+class Listing:
+    __slots__ = ("id", "name", "description")
+
+    def __init__(self, id: str, name: str, description: str):
+        self.id = id
+        self.name = name
+        self.description = description
+
+
+def percentile(samples, p: float) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main(listings: int = 1_000_000, queries: int = 2000, vocabulary: int = 50_000):
+    rng = random.Random(7)
+    words = list({"".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(vocabulary)})
+    weights = list(accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    def phrase(n: int) -> str:
+        return " ".join(rng.choices(words, cum_weights=weights, k=n))
+
+    index = SearchIndex()
+    names = []
+    started = time.perf_counter()
+    for i in range(listings):
+        name = phrase(rng.randint(2, 6))
+        names.append(name)
+        index.add(Listing(str(i), name, phrase(rng.randint(8, 20))))
+    print(f"Indexed {listings:,} listings in {time.perf_counter() - started:.1f}s")
+
+    cases = []
+    for _ in range(queries):
+        kind = rng.random()
+        if kind < 0.3:
+            cases.append(phrase(1))
+        else:
+            tokens = rng.choice(names).split()[:3]
+            if kind < 0.7:
+                # Still typing the last word
+                tokens[-1] = tokens[-1][:rng.randint(1, len(tokens[-1]))]
+            cases.append(" ".join(tokens))
+
+    # Ending auctions come out of the index while queries keep running
+    for i in rng.sample(range(listings), listings // 20):
+        index.remove(Listing(str(i), "", ""))
+
+    # Keep the catalog out of the collector's way, as a long-running server
+    # would, so the numbers are about the index rather than gen2 GC pauses
+    gc.collect()
+    gc.freeze()
+
+    # CPU time too: on a busy or shared machine wall time also counts the
+    # moments the process wasn't running, which shows up in the tail
+    latencies = []
+    cpu_times = []
+    hits = 0
+    for query in cases:
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        results = index.search(query)
+        cpu_times.append((time.thread_time() - cpu_started) * 1000)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += bool(results)
+
+    print(f"{queries:,} queries ({hits:,} with results) over {len(index):,} live listings")
+    print(f"  p50 {percentile(latencies, 0.50):.2f} ms  p99 {percentile(latencies, 0.99):.2f} ms  "
+          f"max {max(latencies):.2f} ms")
+    print(f"  cpu p50 {percentile(cpu_times, 0.50):.2f} ms  p99 {percentile(cpu_times, 0.99):.2f} ms  "
+          f"max {max(cpu_times):.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,65 @@
+"""Time a restart from a snapshot plus log tail against a full bid log replay.
+
+    python benchmarks/bench_snapshot.py [historical_bids] [tail_bids]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auction_agent import AuctionAgent
+from bid_log import BidLog, encode_record
+from storage import MemoryStorage
+
+
+def write_log(path: str, product_ids, count: int, start: int = 0):
+    base_ms = int(time.time() * 1000)
+    with open(path, "ab") as f:
+        chunk = []
+        for i in range(start, start + count):
+            chunk.append(encode_record(product_ids[i % len(product_ids)], f"user{i % 5000}", 5000.0 + i, base_ms + i))
+            if len(chunk) == 100_000:
+                f.write(b"".join(chunk))
+                chunk.clear()
+        f.write(b"".join(chunk))
+
+
+def restart(log_path: str, snapshot_path: str = None):
+    started = time.perf_counter()
+    agent = AuctionAgent(MemoryStorage(BidLog(log_path), snapshot_path=snapshot_path))
+    elapsed = time.perf_counter() - started
+    bids = sum(len(product.bidding_history) for product in agent.products.values())
+    agent.storage.close()
+    return elapsed, bids
+
+
+def main(historical: int = 20_000_000, tail: int = 100_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "bids.log")
+        snapshot_path = os.path.join(tmp, "snapshot.bin")
+        product_ids = [product.id for product in AuctionAgent().products.values()]
+
+        write_log(log_path, product_ids, historical)
+        agent = AuctionAgent(MemoryStorage(BidLog(log_path), snapshot_path=snapshot_path))
+        started = time.perf_counter()
+        captured = agent.capture_snapshot()
+        captured_in = time.perf_counter() - started
+        agent.storage.write_snapshot(captured)
+        written_in = time.perf_counter() - started
+        agent.storage.close()
+        del agent, captured
+        print(f"snapshot of {historical:,} bids: captured in {captured_in * 1e3:.0f}ms, "
+              f"written in {written_in:.2f}s ({os.path.getsize(snapshot_path) / 2**20:,.0f} MiB)")
+
+        write_log(log_path, product_ids, tail, start=historical)
+
+        elapsed, bids = restart(log_path, snapshot_path)
+        print(f"restart from snapshot + {tail:,}-bid log tail: {bids:,} bids in {elapsed:.2f}s")
+        elapsed, bids = restart(log_path)
+        print(f"restart from full log replay:             {bids:,} bids in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,46 @@
+"""Measure SQLiteStorage batched insert rate, reload time and product reads.
+
+    python benchmarks/bench_sqlite_storage.py [bids]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auction_agent import AuctionAgent
+from storage import SQLiteStorage
+
+
+def main(bids: int = 2_000_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "auction.db")
+        agent = AuctionAgent(SQLiteStorage(path))
+        products = list(agent.products.values())
+
+        started = time.perf_counter()
+        for i in range(bids):
+            product = products[i % len(products)]
+            agent.engine.place_bid(product, f"user{i % 5000}", product.current_highest_bid + 1)
+        agent.storage.sync().result()
+        elapsed = time.perf_counter() - started
+        agent.storage.close()
+        print(f"insert: {bids:,} bids in {elapsed:.2f}s ({bids / elapsed:,.0f} bids/s), "
+              f"{os.path.getsize(path) / 2**20:,.0f} MiB on disk")
+
+        started = time.perf_counter()
+        agent = AuctionAgent(SQLiteStorage(path))
+        elapsed = time.perf_counter() - started
+        print(f"reload: {sum(len(p.bidding_history) for p in agent.products.values()):,} bids in {elapsed:.2f}s")
+
+        started = time.perf_counter()
+        for _ in range(10000):
+            product = agent.index.get("1")
+            [(bid.user, bid.amount, bid.timestamp_ms) for bid in product.bidding_history[-10:]]
+        print(f"product read with last 10 bids: {(time.perf_counter() - started) / 10000 * 1e6:.1f}us")
+        agent.storage.close()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
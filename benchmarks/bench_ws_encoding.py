@@ -0,0 +1,85 @@
+"""Encode cost and bytes on the wire for a bid_placed stream, per /ws encoding.
+
+    python benchmarks/bench_ws_encoding.py [events]
+
+Events look like what a busy auction broadcasts: bid_placed with a seq,
+product id, user, amount and result message, a third of them conflated
+updates with an ``absorbed`` count. For each encoding:
+
+  json            json.dumps, what every JSON client is sent
+  orjson          the same with orjson (if installed), for comparison
+  msgpack         msgpack.packb (if installed) with field names as strings
+  msgpack+keys    ws_protocol.encode, the omni.msgpack.v1 format: field names
+                  replaced by their one-byte index in ws_protocol.KEYS
+
+Encoding happens once per event on the server, however many clients share
+it; decoding happens once per event on every client. Bytes include the
+2-byte WebSocket frame header of a small server-to-client frame.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summaries import orjson
+from ws_protocol import encode, loads, msgpack
+
+FRAME_HEADER = 2
+
+
+def events(count: int):
+    rng = random.Random(1)
+    stream = []
+    for seq in range(1, count + 1):
+        amount = round(rng.uniform(10, 5000), 2)
+        event = {
+            "type": "bid_placed",
+            "product_id": str(rng.randrange(100_000)),
+            "user": f"user{rng.randrange(10_000)}",
+            "amount": amount,
+            "message": f"Success! Your bid of ${amount:.2f} is now the highest bid.",
+            "seq": seq
+        }
+        if seq % 3 == 0:
+            event["absorbed"] = rng.randint(2, 20)
+        stream.append(event)
+    return stream
+
+
+def measure(stream, encoder, decoder):
+    started = time.perf_counter()
+    encoded = [encoder(event) for event in stream]
+    encode_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for data in encoded:
+        decoder(data)
+    decode_time = time.perf_counter() - started
+    size = sum(len(data) for data in encoded) / len(encoded) + FRAME_HEADER
+    return encode_time / len(stream) * 1e6, decode_time / len(stream) * 1e6, size
+
+
+def main(count: int = 100_000):
+    stream = events(count)
+    variants = [("json", lambda event: json.dumps(event).encode(), json.loads)]
+    if orjson is not None:
+        variants.append(("orjson", orjson.dumps, orjson.loads))
+    if msgpack is not None:
+        variants.append(("msgpack", msgpack.packb, msgpack.unpackb))
+        variants.append(("msgpack+keys", encode, loads))
+    else:
+        print("msgpack is not installed; only the JSON encodings are measured")
+
+    print(f"{count:,} bid_placed events")
+    print(f"{'encoding':<14}{'encode us/event':>17}{'decode us/event':>17}{'bytes/event':>13}")
+    baseline = None
+    for name, encoder, decoder in variants:
+        encode_us, decode_us, size = measure(stream, encoder, decoder)
+        baseline = baseline or size
+        print(f"{name:<14}{encode_us:>17.2f}{decode_us:>17.2f}{size:>13.1f}  ({size / baseline:.0%} of json)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""Fire thousands of concurrent bids at AuctionAgent and check the invariants.
+
+    python benchmarks/stress_bid_engine.py [threads] [bids_per_thread]
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auction_agent import AuctionAgent
+
+
+def check_invariants(product, start_bid, accepted):
+    history = list(product.bidding_history)
+    amounts = [bid.amount for bid in history]
+    assert len(history) == accepted, f"{product.name}: {accepted} accepted but {len(history)} in history"
+    assert all(a < b for a, b in zip(amounts, amounts[1:])), f"{product.name}: history is not strictly increasing"
+    if amounts:
+        assert amounts[0] > start_bid, f"{product.name}: first bid did not beat the opening price"
+        assert product.current_highest_bid == amounts[-1], f"{product.name}: highest bid does not match history"
+
+
+def run(threads: int = 32, bids_per_thread: int = 500):
+    agent = AuctionAgent()
+    start_bids = {key: product.current_highest_bid for key, product in agent.products.items()}
+    keys = list(agent.products)
+    accepted = {key: 0 for key in keys}
+    counter_lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def bidder(worker: int):
+        rng = random.Random(worker)
+        local = {key: 0 for key in keys}
+        barrier.wait()
+        for _ in range(bids_per_thread):
+            # Three quarters of the traffic hammers one hot product
+            key = keys[0] if rng.random() < 0.75 else rng.choice(keys)
+            product = agent.products[key]
+            if rng.random() < 0.5:
+                seen = product.current_highest_bid
+                result = agent.place_bid(product.id, seen + rng.randint(1, 5), f"user{worker}", expected_highest=seen)
+            else:
+                result = agent.place_bid(product.id, product.current_highest_bid + rng.randint(1, 5), f"user{worker}")
+            if result.startswith("Success"):
+                local[key] += 1
+        with counter_lock:
+            for key, count in local.items():
+                accepted[key] += count
+
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # force frequent thread switches to shake out races
+    try:
+        workers = [threading.Thread(target=bidder, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        sys.setswitchinterval(old_interval)
+
+    for key in keys:
+        check_invariants(agent.products[key], start_bids[key], accepted[key])
+
+    total = threads * bids_per_thread
+    print(f"{total} bids from {threads} threads in {elapsed:.2f}s ({total / elapsed:,.0f} bids/s)")
+    for key in keys:
+        print(f"  {agent.products[key].name}: {accepted[key]} accepted, highest ${agent.products[key].current_highest_bid:,.2f}")
+    print("All invariants hold.")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,62 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+# Longest user name (and product id) a bid may carry: well inside what a bid
+# log record can hold, so recording an accepted bid never fails on its size
+MAX_USER_LENGTH = 255
+
+
+class BidEngine:
+    """Serializes bids per product so check-then-set in Product.place_bid is atomic.
+
+    Locks are striped: each product id hashes onto one of ``shards`` locks, so
+    a storm on one hot product only contends with the few products that share
+    its stripe instead of with the whole catalog.
+
+    When a ``storage`` backend is attached, every accepted bid is recorded to
+    it while the product's lock is still held, so the persisted order matches
+    apply order.
+    """
+
+    def __init__(self, shards: int = 64, storage=None):
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(shards)]
+        self.storage = storage
+
+    def lock_for(self, product_id: str) -> threading.Lock:
+        return self._locks[hash(product_id) % len(self._locks)]
+
+    @contextmanager
+    def all_locks(self) -> Iterator[None]:
+        """Quiesce every product at once, e.g. to capture a consistent snapshot"""
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def place_bid(self, product, user: str, amount: float,
+                  expected_highest: Optional[float] = None) -> str:
+        """Place a bid atomically.
+
+        With ``expected_highest`` set this is a compare-and-set: the bid only
+        goes through if the current highest bid is still the one the caller saw.
+        """
+        with self.lock_for(product.id):
+            if self.storage is not None and self.storage.failed is not None:
+                # It would be applied here but lost on restart
+                return "Error: Bids cannot be recorded right now"
+            if len(user) > MAX_USER_LENGTH or len(product.id) > MAX_USER_LENGTH:
+                # Checked before the product changes: nothing may be applied that can't be recorded
+                return f"Error: User names and product ids are at most {MAX_USER_LENGTH} characters"
+            if expected_highest is not None and product.current_highest_bid != expected_highest:
+                return (
+                    f"Error: Current highest bid changed to ${product.current_highest_bid:.2f} "
+                    f"(expected ${expected_highest:.2f})"
+                )
+            result = product.place_bid(user, amount)
+            if self.storage is not None and result.startswith("Success"):
+                self.storage.record_bid(product.id, user, amount, product.bidding_history.timestamps[-1])
+            return result
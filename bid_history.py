@@ -0,0 +1,111 @@
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class BidView:
+    """Read-only row view over one entry of a BidHistory.
+
+    Exposes the same ``user``/``amount``/``timestamp`` attributes as ``Bid`` so
+    callers that serialize history don't care which one they get.
+    """
+    __slots__ = ("user", "amount", "timestamp_ms")
+
+    def __init__(self, user: str, amount: float, timestamp_ms: int):
+        self.user = user
+        self.amount = amount
+        self.timestamp_ms = timestamp_ms
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp_ms / 1000)
+
+    def __repr__(self) -> str:
+        return f"BidView(user={self.user!r}, amount={self.amount!r}, timestamp={self.timestamp!r})"
+
+
+class BidHistory:
+    """Columnar, append-only bid history.
+
+    Amounts, epoch-ms timestamps and user ids live in parallel typed arrays
+    (20 bytes per bid) and user names are interned once per history, instead
+    of one ``Bid`` dataclass plus a ``datetime`` per row. Indexing and slicing
+    build ``BidView`` rows on demand, so ``history[-10:]`` only materializes
+    ten objects.
+    """
+
+    def __init__(self):
+        self.amounts = array("d")
+        self.timestamps = array("q")
+        self.user_ids = array("I")
+        self.users: List[str] = []
+        self._user_index: Dict[str, int] = {}
+
+    @classmethod
+    def from_columns(cls, amounts, timestamps, user_ids, users: List[str]) -> "BidHistory":
+        """Rebuild a history from raw column buffers (e.g. slices of a mapped snapshot)"""
+        history = cls()
+        history.amounts.frombytes(amounts)
+        history.timestamps.frombytes(timestamps)
+        history.user_ids.frombytes(user_ids)
+        history.users = list(users)
+        history._user_index = {user: i for i, user in enumerate(history.users)}
+        return history
+
+    def add(self, user: str, amount: float, timestamp_ms: int = None) -> None:
+        user_id = self._user_index.get(user)
+        if user_id is None:
+            user_id = self._user_index[user] = len(self.users)
+            self.users.append(user)
+        if timestamp_ms is None:
+            timestamp_ms = now_ms()
+        # Never earlier than the bid before it, even if the clock steps back,
+        # so span() can bisect the timestamps
+        if self.timestamps and timestamp_ms < self.timestamps[-1]:
+            timestamp_ms = self.timestamps[-1]
+        self.amounts.append(amount)
+        self.timestamps.append(timestamp_ms)
+        self.user_ids.append(user_id)
+
+    def append(self, bid) -> None:
+        """List-compatible append of a ``Bid`` (or anything with user/amount/timestamp)"""
+        self.add(bid.user, bid.amount, int(bid.timestamp.timestamp() * 1000))
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def span(self, since_ms: Optional[int] = None, until_ms: Optional[int] = None) -> Tuple[int, int]:
+        """Positions ``[start, end)`` of the bids placed in ``[since_ms, until_ms)``.
+
+        Positions never change once a bid is in, so they double as page
+        cursors; finding them is a bisection of the timestamps column.
+        """
+        start = 0 if since_ms is None else bisect_left(self.timestamps, since_ms)
+        end = len(self.timestamps) if until_ms is None else bisect_left(self.timestamps, until_ms, start)
+        return start, max(start, end)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(len(self.amounts)))]
+        if index < 0:
+            index += len(self.amounts)
+        if not 0 <= index < len(self.amounts):
+            raise IndexError("bid history index out of range")
+        return self._row(index)
+
+    def __iter__(self) -> Iterator[BidView]:
+        users = self.users
+        for amount, timestamp_ms, user_id in zip(self.amounts, self.timestamps, self.user_ids):
+            yield BidView(users[user_id], amount, timestamp_ms)
+
+    def __repr__(self) -> str:
+        return f"BidHistory({len(self)} bids)"
+
+    def _row(self, i: int) -> BidView:
+        return BidView(self.users[self.user_ids[i]], self.amounts[i], self.timestamps[i])
@@ -0,0 +1,184 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import Future
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# crc32, amount, timestamp_ms, len(product_id), len(user); the crc covers
+# everything after itself, payload included.
+_HEADER = struct.Struct("<Idqhh")
+_BODY_OFFSET = 4
+
+BidRecord = Tuple[str, str, float, int]
+
+
+class DurabilityError(Exception):
+    """Storage failed a write, so bids can no longer be made durable"""
+
+
+def encode_record(product_id: str, user: str, amount: float, timestamp_ms: int) -> bytes:
+    pid = product_id.encode()
+    name = user.encode()
+    body = _HEADER.pack(0, amount, timestamp_ms, len(pid), len(name))[_BODY_OFFSET:] + pid + name
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+
+class BidLog:
+    """Append-only, group-committed write-ahead log of accepted bids.
+
+    ``append`` only buffers the record; a single writer thread drains the
+    buffer, writes it and fsyncs once per batch. Every caller that asked for
+    ``sync()`` while that batch was building is released by the same fsync, so
+    a burst of bids shares one flush instead of paying one each.
+
+    On startup, ``replay()`` streams the records back. A torn or corrupt tail
+    left by a crash ends the replay and is truncated away by ``start()``.
+
+    A failed write or fsync stops the log for good (``failed`` is set): that
+    sync and every later one raise DurabilityError, and nothing more is
+    written, so a partial write stays a torn tail instead of being followed
+    by records that replay would never reach.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.position = 0
+        self._durable = 0
+        self._valid_end: Optional[int] = None
+        self._file = None
+        self._buffer = bytearray()
+        self._waiters: List[Tuple[int, Future]] = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+        self.failed: Optional[DurabilityError] = None
+
+    def replay(self, offset: int = 0) -> Iterator[BidRecord]:
+        """Yield (product_id, user, amount, timestamp_ms) for every intact record from ``offset``"""
+        self._valid_end = offset
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= offset:
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from self._scan(data, offset)
+
+    def _scan(self, data, pos: int) -> Iterator[BidRecord]:
+        unpack = _HEADER.unpack_from
+        header_size = _HEADER.size
+        crc32 = zlib.crc32
+        end = len(data)
+        ids = {}
+        users = {}
+        while pos + header_size <= end:
+            crc, amount, timestamp_ms, pid_len, user_len = unpack(data, pos)
+            record_end = pos + header_size + pid_len + user_len
+            if pid_len < 0 or user_len < 0 or record_end > end:
+                break
+            if crc32(data[pos + _BODY_OFFSET:record_end]) != crc:
+                break
+            pid_end = pos + header_size + pid_len
+            raw_pid = data[pos + header_size:pid_end]
+            raw_user = data[pid_end:record_end]
+            product_id = ids.get(raw_pid)
+            if product_id is None:
+                product_id = ids[raw_pid] = raw_pid.decode()
+            user = users.get(raw_user)
+            if user is None:
+                user = users[raw_user] = raw_user.decode()
+            pos = record_end
+            self._valid_end = pos
+            yield product_id, user, amount, timestamp_ms
+        if pos != end:
+            logger.warning("Bid log %s has %d trailing bytes of torn/corrupt data", self.path, end - pos)
+
+    def start(self) -> None:
+        """Open the log for appending (after dropping any torn tail) and start the writer"""
+        if self._valid_end is None:
+            for _ in self.replay():
+                pass
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "ab")
+        end = self._file.tell()
+        if end < self._valid_end:
+            # Replayed from an offset the file never reached; positions must match the file
+            logger.error("Bid log %s ends at byte %d, before replay offset %d", self.path, end, self._valid_end)
+            self._valid_end = end
+        elif end > self._valid_end:
+            self._file.truncate(self._valid_end)
+        self.position = self._durable = self._valid_end
+        self._thread = threading.Thread(target=self._writer, name="bid-log-writer", daemon=True)
+        self._thread.start()
+
+    def size(self) -> int:
+        """Bytes in the log file on disk"""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def append(self, product_id: str, user: str, amount: float, timestamp_ms: int) -> None:
+        record = encode_record(product_id, user, amount, timestamp_ms)
+        with self._cond:
+            if self.failed is not None:
+                return
+            self._buffer += record
+            self.position += len(record)
+            self._cond.notify()
+
+    def sync(self) -> Future:
+        """Future that resolves once everything appended so far is on disk"""
+        future = Future()
+        with self._cond:
+            if self.failed is not None:
+                future.set_exception(DurabilityError(str(self.failed)))
+                return future
+            target = self.position
+            if target <= self._durable:
+                future.set_result(target)
+                return future
+            self._waiters.append((target, future))
+        return future
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _writer(self) -> None:
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closing:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                batch, self._buffer = self._buffer, bytearray()
+                batch_end = self.position
+            try:
+                self._file.write(batch)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception as exc:
+                logger.exception("Failed to write bid log batch; no more bids can be made durable")
+                with self._cond:
+                    self.failed = DurabilityError(f"Bid log {self.path} failed: {exc}")
+                    failed, self._waiters = self._waiters, []
+                    self._buffer = bytearray()
+                for _, future in failed:
+                    future.set_exception(DurabilityError(str(self.failed)))
+                return
+            with self._cond:
+                self._durable = batch_end
+                # Callers that synced while this batch was in flight wait for the next one
+                done = [future for target, future in self._waiters if target <= batch_end]
+                self._waiters = [(target, future) for target, future in self._waiters if target > batch_end]
+            for future in done:
+                future.set_result(batch_end)
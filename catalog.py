@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Tuple
+
+from auction_agent import AuctionAgent, Product
+from product_index import normalize
+
+
+def iter_catalog(path: str) -> Iterator[Tuple[str, Product]]:
+    """Stream (key, Product) pairs from a .jsonl/.ndjson or .csv catalog file.
+
+    Rows are read one at a time, so the file is never held in memory. Each row
+    needs ``id`` and ``name``; ``key``, ``description``, ``current_highest_bid``
+    (or ``starting_bid``) and either ``auction_end_time`` (ISO 8601) or
+    ``duration_minutes`` are optional.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if extension == ".csv":
+            rows = csv.DictReader(f)
+        elif extension in (".jsonl", ".ndjson"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"Unsupported catalog format: {path}")
+        for row in rows:
+            yield product_from_row(row)
+
+
+def product_from_row(row: Dict) -> Tuple[str, Product]:
+    product_id = str(row["id"])
+    name = row["name"]
+    key = row.get("key") or normalize(name).replace(" ", "_") or product_id
+
+    if row.get("auction_end_time"):
+        auction_end_time = parse_end_time(row["auction_end_time"])
+    else:
+        auction_end_time = datetime.now() + timedelta(minutes=float(row.get("duration_minutes") or 10))
+
+    opening_bid = row.get("current_highest_bid") or row.get("starting_bid") or 0.0
+    return key, Product(
+        id=product_id,
+        name=name,
+        description=row.get("description") or "",
+        current_highest_bid=float(opening_bid),
+        auction_end_time=auction_end_time,
+    )
+
+
+def parse_end_time(value: str) -> datetime:
+    """An ISO 8601 time as the naive local datetime the rest of the code compares
+    against ``datetime.now()``; one with an offset (or ``Z``) is converted"""
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def load_catalog(agent: AuctionAgent, path: str) -> int:
+    """Import a catalog file into the agent, skipping ids it already has"""
+    return agent.add_products(iter_catalog(path))
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TICK_MS = 50
+
+
+class Conflator:
+    """Collapses bursts of bids into one update per product per tick.
+
+    ``add`` keeps only the latest bid for each product and counts how many it
+    absorbed; every ``tick`` seconds each pending update is passed to ``emit``
+    as a ``bid_placed`` event with an ``absorbed`` count. The update carries
+    the seq of the last event it covers, so resuming from it works as usual.
+    """
+
+    def __init__(self, tick: float, emit: Callable[[dict], None]):
+        self.tick = tick
+        self.emit = emit
+        self._pending: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, bid: dict, seq: int) -> None:
+        pending = self._pending.get(bid["product_id"])
+        if pending is None:
+            self._pending[bid["product_id"]] = dict(bid, type="bid_placed", seq=seq, absorbed=1)
+        else:
+            absorbed = pending["absorbed"] + 1
+            pending.update(bid, type="bid_placed", seq=seq, absorbed=absorbed)
+
+    def flush(self) -> None:
+        """Emit everything pending now"""
+        pending, self._pending = self._pending, {}
+        # In seq order, so a client resuming from the last seq it saw misses nothing
+        for update in sorted(pending.values(), key=lambda update: update["seq"]):
+            self.emit(update)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to emit conflated updates")
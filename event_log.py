@@ -0,0 +1,50 @@
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional
+
+DEFAULT_CAPACITY = 10000
+
+
+class EventLog:
+    """Sequence numbers and a bounded ring of recent auction events.
+
+    Every event gets the next ``seq`` before it is sent, so a client that
+    reconnects can ask for everything after the last one it saw. The ring
+    only keeps the latest ``capacity`` events; older gaps need a snapshot.
+    ``epoch`` changes on every restart, since sequence numbers start over.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._events: Deque[Dict] = deque(maxlen=capacity)
+
+    def append(self, event: Dict) -> Dict:
+        self.seq += 1
+        event["seq"] = self.seq
+        self._events.append(event)
+        return event
+
+    def record(self, event: Dict) -> Dict:
+        """Keep an event that was already sequenced elsewhere (by the leader worker)"""
+        self.seq = event["seq"]
+        self._events.append(event)
+        return event
+
+    def restart(self, epoch: str, seq: int) -> None:
+        """Take over another log's numbering, forgetting everything buffered"""
+        self.epoch = epoch
+        self.seq = seq
+        self._events.clear()
+
+    def since(self, seq: int, epoch: Optional[str] = None) -> Optional[List[Dict]]:
+        """Events after ``seq``, or None if they can't all be replayed"""
+        if (epoch is not None and epoch != self.epoch) or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        oldest = self.seq - len(self._events) + 1
+        if seq + 1 < oldest:
+            return None
+        return list(islice(self._events, seq + 1 - oldest, None))
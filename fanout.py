@@ -0,0 +1,196 @@
+import asyncio
+import logging
+from collections import deque
+from itertools import chain
+from typing import Callable, Collection, Deque, Dict, Iterable, Optional, Set, Union
+
+from ws_protocol import Frame
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 1024
+# Close code for evicted consumers: "try again later"
+EVICTED = 1013
+CLOSE_TIMEOUT = 1.0
+
+# Queued in place of the events a lagging subscriber was too slow to take
+_SNAPSHOT = object()
+
+
+class Subscriber:
+    """The outbound side of one WebSocket: a bounded queue drained by its own task.
+
+    Messages arrive already serialized: a str goes out as is, and a Frame goes
+    out in the subscriber's wire format (MessagePack if ``binary``, else JSON),
+    encoded once however many subscribers share it. When the queue fills up,
+    the events still waiting are dropped and the subscriber gets a fresh
+    snapshot instead; if it fills up again before that snapshot has even gone
+    out, ``send`` returns False and the subscriber should be evicted.
+    """
+
+    def __init__(self, websocket, snapshot: Callable[[Optional[Set[str]]], dict],
+                 queue_size: int = DEFAULT_QUEUE_SIZE, topics: Optional[Set[str]] = None, binary: bool = False):
+        self.websocket = websocket
+        self.topics = topics
+        self.binary = binary
+        self.capacity = queue_size
+        self.lagging = False
+        self.task: Optional[asyncio.Task] = None
+        # A plain deque and one wakeup future: asyncio.Queue costs several
+        # times more per put, which adds up across tens of thousands of sockets
+        self._queue: Deque = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._snapshot = snapshot
+        self._skip_through = 0
+
+    def wants(self, topics: Optional[Collection[str]]) -> bool:
+        return topics is None or self.topics is None or not self.topics.isdisjoint(topics)
+
+    def send(self, message: Union[str, Frame], seq: Optional[int] = None) -> bool:
+        """Queue a message; False if the subscriber is too far behind to keep"""
+        if len(self._queue) >= self.capacity:
+            if self.lagging:
+                return False
+            self.request_snapshot()
+            return True
+        self._queue.append((seq, message))
+        self._wake()
+        return True
+
+    def request_snapshot(self) -> None:
+        """Replace every event queued with the current state. Messages without a
+        seq (the hello, replies to commands) stay, ahead of the snapshot: it
+        doesn't cover them"""
+        kept = [item for item in self._queue if item is not _SNAPSHOT and item[0] is None]
+        self._queue.clear()
+        self._queue.extend(kept)
+        self._queue.append(_SNAPSHOT)
+        self.lagging = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def run(self) -> None:
+        queue = self._queue
+        while True:
+            if not queue:
+                self._waiter = asyncio.get_running_loop().create_future()
+                await self._waiter
+                self._waiter = None
+                continue
+            item = queue.popleft()
+            if item is _SNAPSHOT:
+                snapshot = self._snapshot(self.topics)
+                # Events queued behind the snapshot that it already covers are skipped
+                self._skip_through = snapshot["seq"]
+                self.lagging = False
+                await self._send(Frame(snapshot))
+                continue
+            seq, message = item
+            if seq is not None and seq <= self._skip_through:
+                continue
+            await self._send(message)
+
+    async def _send(self, message: Union[str, Frame]) -> None:
+        if message.__class__ is str:
+            await self.websocket.send_text(message)
+        elif self.binary:
+            await self.websocket.send_bytes(message.binary)
+        else:
+            await self.websocket.send_text(message.text)
+
+    async def close(self, code: int) -> None:
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), CLOSE_TIMEOUT)
+        except Exception:
+            pass
+
+
+class Fanout:
+    """Delivers each serialized message to its subscribers without waiting on any of them.
+
+    A subscriber with ``topics`` of None gets everything; otherwise it only
+    gets messages published under one of its topics (product ids), found
+    through a topic -> subscribers index rather than by scanning everyone.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.firehose: Set[Subscriber] = set()
+        self.topics: Dict[str, Set[Subscriber]] = {}
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def add(self, subscriber: Subscriber) -> None:
+        self.subscribers.add(subscriber)
+        if subscriber.topics is None:
+            self.firehose.add(subscriber)
+        else:
+            for topic in subscriber.topics:
+                self.topics.setdefault(topic, set()).add(subscriber)
+        subscriber.task = asyncio.create_task(self._run(subscriber))
+
+    def remove(self, subscriber: Subscriber) -> None:
+        self._forget(subscriber)
+        if subscriber.task is not None:
+            subscriber.task.cancel()
+
+    def subscribe(self, subscriber: Subscriber, topics: Iterable[str]) -> None:
+        """Narrow a subscriber to (or widen it by) the given topics"""
+        if subscriber.topics is None:
+            subscriber.topics = set()
+            self.firehose.discard(subscriber)
+        for topic in topics:
+            subscriber.topics.add(topic)
+            self.topics.setdefault(topic, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber, topics: Iterable[str]) -> None:
+        if subscriber.topics is None:
+            return
+        for topic in topics:
+            subscriber.topics.discard(topic)
+            self._drop_topic(topic, subscriber)
+
+    def publish(self, message: Union[str, Frame], seq: Optional[int] = None,
+                topics: Optional[Collection[str]] = None) -> None:
+        """Queue ``message`` for firehose subscribers and anyone subscribed to one
+        of ``topics``; with no topics it goes to everyone"""
+        if topics is None:
+            recipients = self.subscribers
+        else:
+            interested = [self.topics[topic] for topic in topics if topic in self.topics]
+            if len(interested) > 1:
+                interested = [set().union(*interested)]
+            recipients = chain(self.firehose, *interested)
+        evicted = [subscriber for subscriber in recipients if not subscriber.send(message, seq)]
+        for subscriber in evicted:
+            logger.info("Evicting slow WebSocket consumer")
+            self.remove(subscriber)
+            asyncio.create_task(subscriber.close(EVICTED))
+
+    def _forget(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+        self.firehose.discard(subscriber)
+        for topic in subscriber.topics or ():
+            self._drop_topic(topic, subscriber)
+
+    def _drop_topic(self, topic: str, subscriber: Subscriber) -> None:
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.topics[topic]
+
+    async def _run(self, subscriber: Subscriber) -> None:
+        try:
+            await subscriber.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The client went away mid-send; the receive loop sees the disconnect
+            pass
+        finally:
+            self._forget(subscriber)
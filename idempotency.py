@@ -0,0 +1,66 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Tuple, TypeVar
+
+DEFAULT_TTL = 3600.0
+DEFAULT_MAX_ENTRIES = 100_000
+
+T = TypeVar("T")
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key came back with a different request than its first use"""
+
+
+class IdempotencyCache:
+    """Outcomes of requests that carried an idempotency key, kept ``ttl`` seconds.
+
+    The first request with a key runs; a repeat (same key and fingerprint)
+    gets the stored result without running anything, and one that arrives
+    while the first is still running waits for it. A run that raises stores
+    nothing, so it can be retried. Entries expire oldest first, and past
+    ``max_entries`` the oldest go early.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.replays = 0
+        # key -> (expiry, fingerprint, outcome); insertion order is expiry order
+        self._entries: "OrderedDict[str, Tuple[float, str, asyncio.Future]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def run(self, key: str, fingerprint: str, call: Callable[[], Awaitable[T]]) -> T:
+        now = time.monotonic()
+        entries = self._entries
+        while entries and next(iter(entries.values()))[0] <= now:
+            entries.popitem(last=False)
+
+        entry = entries.get(key)
+        if entry is not None:
+            if entry[1] != fingerprint:
+                raise IdempotencyConflict(key)
+            self.replays += 1
+            return await asyncio.shield(entry[2])
+
+        outcome = asyncio.get_running_loop().create_future()
+        entry = entries[key] = (now + self.ttl, fingerprint, outcome)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        try:
+            result = await call()
+        except BaseException as exc:
+            if entries.get(key) is entry:
+                del entries[key]
+            if isinstance(exc, asyncio.CancelledError):
+                outcome.cancel()
+            else:
+                outcome.set_exception(exc)
+                # Retrieved here so an outcome nobody else waited on isn't reported as lost
+                outcome.exception()
+            raise
+        outcome.set_result(result)
+        return result
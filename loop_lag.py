@@ -0,0 +1,52 @@
+import asyncio
+from collections import deque
+from typing import Deque, Optional
+
+DEFAULT_INTERVAL = 0.1
+DEFAULT_WINDOW = 10
+
+
+class LoopLagMonitor:
+    """Measures how far behind the event loop is running.
+
+    Every ``interval`` seconds a background task sleeps and records how late
+    it woke up: a loop kept busy (say, by a broadcast storm) runs every
+    callback late, this one included. ``lag`` is the worst of the last
+    ``window`` samples, or of the sample still overdue, so saturation shows
+    up within a sampling interval and clears about ``interval * window``
+    seconds after it ends.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, window: int = DEFAULT_WINDOW):
+        self.interval = interval
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._deadline: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def lag(self) -> float:
+        """Seconds; 0.0 until the monitor is running"""
+        worst = max(self.samples, default=0.0)
+        if self._deadline is not None:
+            worst = max(worst, asyncio.get_running_loop().time() - self._deadline)
+        return worst
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._deadline = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._deadline = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - self._deadline))
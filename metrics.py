@@ -0,0 +1,172 @@
+import heapq
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; from a fast in-memory lookup up to a slow fsync
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Labels = Tuple[str, ...]
+# (name suffix, label names, label values, value) for one line of output
+Sample = Tuple[str, Sequence[str], Sequence[str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """One metric family. Updates are plain dict and list arithmetic on the
+    event loop thread, with no locks; all the formatting happens at scrape time."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            if names:
+                labels = ",".join(f'{name}="{_escape(str(label))}"' for name, label in zip(names, values))
+                lines.append(f"{self.name}{suffix}{{{labels}}} {_format(value)}")
+            else:
+                lines.append(f"{self.name}{suffix} {_format(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        values = self._values
+        values[labels] = values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self._values.items():
+            yield "", self.labelnames, labels, value
+
+
+class Gauge(Metric):
+    """Read at scrape time from ``read``, which returns the value (or a
+    {label values: value} dict when there are label names), so keeping it
+    current costs nothing"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], object], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.read = read
+
+    def samples(self) -> Iterable[Sample]:
+        value = self.read()
+        if not self.labelnames:
+            yield "", (), (), value
+            return
+        for labels, labelled in value.items():
+            yield "", self.labelnames, labels, labelled
+
+
+class CallbackCounter(Gauge):
+    """A counter something else already keeps, read at scrape time"""
+
+    kind = "counter"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(buckets)
+        # label values -> per-bucket counts (the last one past every bound), then the sum
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.bounds) + 1) + [0.0]
+        series[bisect_left(self.bounds, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> Iterable[Sample]:
+        names = self.labelnames + ("le",)
+        for labels, series in self._series.items():
+            total = 0
+            for bound, count in zip(self.bounds + (math.inf,), series):
+                total += count
+                yield "_bucket", names, labels + (_format(bound),), total
+            yield "_sum", self.labelnames, labels, series[-1]
+            yield "_count", self.labelnames, labels, total
+
+
+class TopCounter(Metric):
+    """A counter per key for keys too many to export (such as product ids):
+    every key is counted, and a scrape reports the ``limit`` largest"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelname: str, limit: int = 100):
+        super().__init__(name, help, (labelname,))
+        self.limit = limit
+        self._values: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def inc(self, key: str, amount: int = 1) -> None:
+        values = self._values
+        values[key] = values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        values = self._values
+        if len(values) > self.limit:
+            top = heapq.nlargest(self.limit, values.items(), key=lambda item: item[1])
+        else:
+            top = values.items()
+        for key, value in top:
+            yield "", self.labelnames, (key,), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, read: Callable[[], object], labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, read, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
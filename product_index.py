@@ -0,0 +1,105 @@
+import re
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Union
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace so 'RTX-5090' == 'rtx 5090'"""
+    return " ".join(tokenize(text))
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class ProductIndex:
+    """Lookup tables over the auction catalog.
+
+    Exact ids, catalog keys and normalized names resolve with a single dict
+    hit. Everything else goes through a prefix index: every query token must be
+    a prefix of some token in the product's key or name, and ties go to the
+    product that was added first (the order the old linear scan used).
+
+    The prefix index maps every prefix of every token to the positions (in
+    ``ordered``) of the products having it. A new product always takes the
+    last position, so appending keeps each list sorted, and a lookup never has
+    to merge or sort: the first position that passes is the answer.
+    """
+
+    def __init__(self):
+        self.by_id: Dict[str, object] = {}
+        self.by_key: Dict[str, object] = {}
+        self.by_name: Dict[str, object] = {}
+        self.ordered: List[object] = []
+        self._tokens: List[List[str]] = []
+        # Most prefixes belong to a single product, so that position is stored
+        # as a bare int; a second one turns it into an array
+        self._prefixes: Dict[str, Union[int, array]] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_key)
+
+    def add(self, key: str, product) -> None:
+        position = len(self.ordered)
+        self.ordered.append(product)
+        self.by_id.setdefault(product.id, product)
+        self.by_key.setdefault(key.lower(), product)
+        self.by_name.setdefault(normalize(product.name), product)
+        tokens = list(dict.fromkeys(tokenize(key) + tokenize(product.name)))
+        self._tokens.append(tokens)
+        prefixes = self._prefixes
+        for prefix in {token[:end] for token in tokens for end in range(1, len(token) + 1)}:
+            positions = prefixes.get(prefix)
+            if positions is None:
+                prefixes[prefix] = position
+            elif positions.__class__ is int:
+                prefixes[prefix] = array("I", (positions, position))
+            else:
+                positions.append(position)
+
+    def get(self, product_id: str):
+        return self.by_id.get(product_id)
+
+    def find(self, query: str):
+        product = self.by_id.get(query)
+        if product is not None:
+            return product
+
+        lowered = query.lower().strip()
+        product = self.by_key.get(lowered)
+        if product is not None:
+            return product
+
+        normalized = normalize(lowered)
+        product = self.by_name.get(normalized)
+        if product is not None:
+            return product
+
+        return self._find_by_prefix(normalized.split())
+
+    def _find_by_prefix(self, tokens: List[str]):
+        if not tokens:
+            return None
+
+        # Walk the positions of the query token with the fewest products, oldest
+        # first, and return the first one every other token's (sorted) positions
+        # also hold, checking the shortest lists first
+        matches = []
+        for token in set(tokens):
+            positions = self._prefixes.get(token)
+            if positions is None:
+                return None
+            matches.append((positions,) if positions.__class__ is int else positions)
+        matches.sort(key=len)
+        driver, rest = matches[0], matches[1:]
+        for position in driver:
+            for positions in rest:
+                i = bisect_left(positions, position)
+                if i == len(positions) or positions[i] != position:
+                    break
+            else:
+                return self.ordered[position]
+        return None
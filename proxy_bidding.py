@@ -0,0 +1,72 @@
+import heapq
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+PROXY_INCREMENT = 1.0
+
+
+class ProxyBook:
+    """Registered maximum bids for one product, kept in a max-heap.
+
+    Each user has at most one live entry; re-registering pushes a new entry
+    and the old one is dropped lazily when it surfaces. Equal maxima are won
+    by whoever registered first.
+    """
+
+    def __init__(self, increment: float = PROXY_INCREMENT):
+        self.increment = increment
+        self._heap: List[Tuple[float, int, str]] = []
+        self._live: Dict[str, int] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def register(self, user: str, max_amount: float) -> None:
+        seq = next(self._counter)
+        self._live[user] = seq
+        heapq.heappush(self._heap, (-max_amount, seq, user))
+
+    def cancel(self, user: str) -> None:
+        self._live.pop(user, None)
+
+    def resolve(self, current_bid: float, leader: Optional[str]) -> Optional[Tuple[str, float]]:
+        """The counter-bid (user, amount) the proxies place against the current price, if any.
+
+        The strongest proxy bids just enough to beat both the current price
+        and the runner-up proxy, capped at its own maximum.
+        """
+        top = self._pop_live()
+        if top is None:
+            return None
+        runner_up = self._peek_live()
+        heapq.heappush(self._heap, top)
+
+        top_max, user = -top[0], top[2]
+        if top_max <= current_bid:
+            # Every registered maximum is already beaten
+            self._heap.clear()
+            self._live.clear()
+            return None
+
+        rival = -runner_up[0] if runner_up is not None else 0.0
+        if user == leader:
+            if rival <= current_bid:
+                return None
+            return user, min(top_max, rival + self.increment)
+        return user, min(top_max, max(current_bid, rival) + self.increment)
+
+    def _pop_live(self):
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._live.get(entry[2]) == entry[1]:
+                return entry
+        return None
+
+    def _peek_live(self):
+        while self._heap:
+            entry = self._heap[0]
+            if self._live.get(entry[2]) == entry[1]:
+                return entry
+            heapq.heappop(self._heap)
+        return None
@@ -0,0 +1,101 @@
+import math
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+DEFAULT_MAX_KEYS = 1_000_000
+
+
+class TokenBuckets:
+    """One token bucket per key, refilling at ``rate`` tokens a second up to ``burst``.
+
+    Bucket state is two floats in flat arrays, addressed through a key ->
+    slot map kept in least-recently-used order. A bucket left alone for
+    ``burst / rate`` seconds is full again, exactly as if it had never
+    existed, so those are recycled from the front of the map whenever a new
+    key arrives; past ``max_keys`` the least recently used is recycled even
+    if it isn't full yet. Memory stays proportional to the keys active in
+    the last refill window, capped at ``max_keys``.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = DEFAULT_MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._tokens = array("d")
+        self._updated = array("d")
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def wait(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Seconds until ``key``'s bucket holds ``cost`` tokens: 0.0 if it does
+        now, infinity if ``cost`` is more than a full bucket. Spends nothing"""
+        if cost > self.burst:
+            return math.inf
+        if now is None:
+            now = time.monotonic()
+        slot = self._slots.get(key)
+        if slot is None:
+            return 0.0
+        tokens = min(self.burst, self._tokens[slot] + (now - self._updated[slot]) * self.rate)
+        return 0.0 if tokens >= cost else (cost - tokens) / self.rate
+
+    def take(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Spend ``cost`` tokens from ``key``'s bucket. Returns 0.0 if they were
+        there, otherwise what ``wait`` would (nothing is spent)"""
+        if cost > self.burst:
+            return math.inf
+        if now is None:
+            now = time.monotonic()
+        slot = self._slots.get(key)
+        if slot is None:
+            self._expire(now)
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._tokens)
+                self._tokens.append(0.0)
+                self._updated.append(0.0)
+            self._slots[key] = slot
+            tokens = self.burst
+        else:
+            self._slots.move_to_end(key)
+            tokens = min(self.burst, self._tokens[slot] + (now - self._updated[slot]) * self.rate)
+        self._updated[slot] = now
+        if tokens >= cost:
+            self._tokens[slot] = tokens - cost
+            return 0.0
+        self._tokens[slot] = tokens
+        return (cost - tokens) / self.rate
+
+    def _expire(self, now: float) -> None:
+        slots = self._slots
+        refilled = now - self.burst / self.rate
+        while slots:
+            key, slot = next(iter(slots.items()))
+            if len(slots) < self.max_keys and self._updated[slot] > refilled:
+                return
+            slots.popitem(last=False)
+            self._free.append(slot)
+
+
+class ConcurrencyLimit:
+    """Caps how many requests are inside a section at once; over the cap they
+    are turned away rather than queued"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+
+    def try_acquire(self) -> bool:
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
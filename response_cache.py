@@ -0,0 +1,67 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 4096
+# Bodies include time_remaining, so even an unchanged product's body goes stale
+DEFAULT_MAX_AGE = 1.0
+
+# Versions are only unique within one process; the ETag says which process
+# (and which run) issued it, so another worker's or a restarted server's
+# version can never be mistaken for ours
+_ISSUER = uuid.uuid4().hex[:8]
+
+
+def etag(version: int) -> str:
+    """Weak: the body also holds a time_remaining that changes between versions"""
+    return f'W/"{_ISSUER}-{version}"'
+
+
+def not_modified(if_none_match: Optional[str], tag: str) -> bool:
+    """Whether an If-None-Match header already names ``tag`` (weak comparison)"""
+    if not if_none_match:
+        return False
+    tag = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == tag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Serialized responses keyed by request, valid while the state version they
+    were built from is current.
+
+    An entry built from an older version is rebuilt on the next ``get``, as is
+    one older than ``max_age`` seconds, so the time_remaining it carries stays
+    close to the truth. The least recently used entries are dropped past
+    ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_age: float = DEFAULT_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, bytes, object]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: int) -> Optional[Tuple[bytes, object]]:
+        """(body, extra) cached for ``key`` at ``version``, if still fresh"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version or time.monotonic() - entry[1] > self.max_age:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2], entry[3]
+
+    def put(self, key: Hashable, version: int, body: bytes, extra: object = None) -> None:
+        self._entries[key] = (version, time.monotonic(), body, extra)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -5,9 +5,23 @@ echo "Starting FastAPI server..."
 uvicorn api.main:app --reload &
 FASTAPI_PID=$!
 
-# Wait for the server to start
+# Wait for the server to answer its health check (recovering a large bid log can take a while)
 echo "Waiting for server to start..."
-sleep 5
+for _ in $(seq 1 120); do
+    if curl -sf http://localhost:8000/health > /dev/null; then
+        break
+    fi
+    if ! kill -0 $FASTAPI_PID 2>/dev/null; then
+        echo "FastAPI server exited during startup"
+        exit 1
+    fi
+    sleep 0.5
+done
+if ! curl -sf http://localhost:8000/health > /dev/null; then
+    echo "FastAPI server did not become healthy within 60 seconds"
+    kill $FASTAPI_PID 2>/dev/null
+    exit 1
+fi
 
 # Start the Streamlit dashboard in the background
 echo "Starting Streamlit dashboard..."
@@ -0,0 +1,272 @@
+import math
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from heapq import heappush, heapreplace, nlargest
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from product_index import tokenize
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Most tokens the final (prefix) query token expands to, most frequent first
+MAX_EXPANSIONS = 32
+# Most documents examined for one query: this bounds the slowest queries
+MAX_CANDIDATES = 750
+# Term frequencies at or above this share a postings tier
+_TF_CAP = 8
+
+# (term frequency, document length bucket) -> doc ids
+Tiers = Dict[Tuple[int, int], array]
+
+
+def _length_bucket(length: int) -> int:
+    """Exact below 16, then four buckets per power of two, so a bucket's
+    shortest length is within 25% of its longest"""
+    if length < 16:
+        return length
+    bits = length.bit_length()
+    return 16 + (bits - 5) * 4 + ((length >> (bits - 3)) & 3)
+
+
+def _shortest_length(bucket: int) -> int:
+    if bucket < 16:
+        return bucket
+    bits, quarter = divmod(bucket - 16, 4)
+    return (4 + quarter) << (bits + 2)
+
+
+def _saturation(tf: float, length: float, avg_length: float) -> float:
+    return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+
+class SearchIndex:
+    """Inverted index over product names and descriptions, ranked with BM25.
+
+    Every query token has to match, the last one as a prefix so results show
+    up while a name is still being typed. Postings are split into tiers by
+    term frequency and document length, the two things BM25 weighs besides
+    idf, so a query walks its rarest token's best tiers first and stops once
+    no remaining tier can reach the current top results. Queries made only of
+    very common tokens stop after MAX_CANDIDATES documents instead, so their
+    ranking is approximate, and a rare combination of them may find nothing.
+
+    Removing a product leaves a tombstone; a token's postings are rebuilt once
+    half of them point at removed products.
+    """
+
+    def __init__(self):
+        self._docs: List[Optional[object]] = []
+        self._doc_terms: List[Optional[Tuple[int, ...]]] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._term_ids: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self._postings: List[Tiers] = []
+        self._df: List[int] = []
+        self._dead: List[int] = []
+        self._sorted_terms: List[str] = []
+        self._sorted_ids: List[int] = []
+        self._live = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def add(self, product) -> None:
+        if product.id in self._doc_ids:
+            self.remove(product)
+        # A tuple rather than an array: it holds the interned term id objects, so
+        # the count() calls scoring does are identity compares
+        terms = tuple(map(self._term_id, tokenize(product.name) + tokenize(product.description)))
+        doc = len(self._docs)
+        self._docs.append(product)
+        self._doc_terms.append(terms)
+        self._doc_ids[product.id] = doc
+        self._live += 1
+        self._total_length += len(terms)
+
+        bucket = _length_bucket(len(terms))
+        for term, tf in Counter(terms).items():
+            tiers = self._postings[term]
+            key = (min(tf, _TF_CAP), bucket)
+            postings = tiers.get(key)
+            if postings is None:
+                tiers[key] = array("I", (doc,))
+            else:
+                postings.append(doc)
+            self._df[term] += 1
+
+    def remove(self, product) -> None:
+        doc = self._doc_ids.pop(product.id, None)
+        if doc is None:
+            return
+        terms = self._doc_terms[doc]
+        self._docs[doc] = None
+        self._doc_terms[doc] = None
+        self._live -= 1
+        self._total_length -= len(terms)
+        for term in set(terms):
+            self._df[term] -= 1
+            self._dead[term] += 1
+            if self._dead[term] > self._df[term]:
+                self._compact(term)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[object, float]]:
+        """Up to ``limit`` (product, score) pairs, best first"""
+        tokens = tokenize(query)
+        if not tokens or not self._live:
+            return []
+
+        # One group per query token: its idf and the term ids it matches. The
+        # expansions of a prefix are scored as synonyms, the way Lucene does:
+        # their largest tf in the document, weighted by the idf of the most
+        # common of them, so a rare completion can't outrank the word itself.
+        groups: List[Tuple[float, FrozenSet[int]]] = []
+        for token in tokens[:-1]:
+            term = self._term_ids.get(token)
+            if term is None or not self._df[term]:
+                return []
+            groups.append((self._idf(term), frozenset((term,))))
+        expansions = self._expand(tokens[-1])
+        if not expansions:
+            return []
+        groups.append((self._idf(max(expansions, key=self._df.__getitem__)), frozenset(expansions)))
+
+        avg_length = self._total_length / self._live
+        driver = min(groups, key=lambda group: sum(self._df[term] for term in group[1]))
+        others = [group for group in groups if group is not driver]
+
+        # Walk the driver's postings best tier first. Within a tier no document
+        # can score more than the tier's bound plus what the other groups can
+        # add at that document length, so once the top results beat that the
+        # rest of the tier, and every later tier, can be skipped.
+        other_bounds: Dict[int, float] = {}
+        for other_idf, other_terms in others:
+            best_tf: Dict[int, int] = {}
+            for term in other_terms:
+                for tf, bucket in self._postings[term]:
+                    if tf > best_tf.get(bucket, 0):
+                        best_tf[bucket] = tf
+            for bucket, tf in best_tf.items():
+                bound = other_idf * self._saturation_bound(tf, _shortest_length(bucket), avg_length)
+                other_bounds[bucket] = other_bounds.get(bucket, 0.0) + bound
+
+        tiers = []
+        idf = driver[0]
+        exact = len(driver[1]) == 1
+        for term in driver[1]:
+            for (tf, bucket), postings in self._postings[term].items():
+                bound = idf * self._saturation_bound(tf, _shortest_length(bucket), avg_length)
+                # Below the cap a tier's tf is the driver's exact tf in every document
+                known_tf = tf if exact and tf < _TF_CAP else 0
+                tiers.append((bound + other_bounds.get(bucket, 0.0), known_tf, postings))
+        tiers.sort(key=lambda tier: tier[0], reverse=True)
+
+        # Scoring is inlined: this loop is the whole cost of a query. Most
+        # candidates of a common driver lack some other group, so every
+        # candidate is first checked for the other groups, rarest first and
+        # without building anything; only the rest are scored. The driver is
+        # scored last, and not at all when its tier already says its tf.
+        top: List[Tuple[float, int]] = []
+        # A document can only turn up twice if the driver is a prefix group
+        seen = set()
+        candidates = 0
+        doc_terms = self._doc_terms
+        others.sort(key=lambda group: sum(self._df[term] for term in group[1]))
+        scorers = [(idf, next(iter(group)) if len(group) == 1 else None, group) for idf, group in others]
+        checks = [(term, group) for _, term, group in scorers]
+        with_driver = scorers + [(idf, next(iter(driver[1])) if exact else None, driver[1])]
+        length_norm = K1 * B / avg_length
+        for bound, known_tf, postings in tiers:
+            if candidates >= MAX_CANDIDATES or (len(top) == limit and top[0][0] >= bound):
+                break
+            tier_scorers = scorers if known_tf else with_driver
+            for doc in postings:
+                if not exact:
+                    if doc in seen:
+                        continue
+                    seen.add(doc)
+                if candidates >= MAX_CANDIDATES:
+                    break
+                candidates += 1
+                terms = doc_terms[doc]
+                if terms is None:
+                    continue
+                for term, group in checks:
+                    if term is not None:
+                        if term not in terms:
+                            break
+                    elif group.isdisjoint(terms):
+                        break
+                else:
+                    norm = K1 * (1 - B) + length_norm * len(terms)
+                    score = idf * known_tf * (K1 + 1) / (known_tf + norm)
+                    for group_idf, term, group in tier_scorers:
+                        if term is not None:
+                            tf = terms.count(term)
+                        else:
+                            tf = max(map(terms.count, group.intersection(terms)))
+                        score += group_idf * tf * (K1 + 1) / (tf + norm)
+                    if len(top) < limit:
+                        heappush(top, (score, -doc))
+                    elif (score, -doc) > top[0]:
+                        heapreplace(top, (score, -doc))
+                    # Only a new result can end the tier early
+                    if len(top) == limit and top[0][0] >= bound:
+                        break
+
+        top.sort(reverse=True)
+        return [(self._docs[-doc], score) for score, doc in top]
+
+    @staticmethod
+    def _saturation_bound(tf: int, length: int, avg_length: float) -> float:
+        """Largest tf component a tier's documents can have: the shortest
+        length in its bucket, and unbounded tf in the top tier"""
+        if tf == _TF_CAP:
+            return K1 + 1
+        return _saturation(tf, length, avg_length)
+
+    def _idf(self, term: int) -> float:
+        df = self._df[term]
+        return math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+
+    def _expand(self, prefix: str) -> List[int]:
+        start = bisect_left(self._sorted_terms, prefix)
+        end = bisect_left(self._sorted_terms, prefix + "\uffff", start)
+        if end - start <= MAX_EXPANSIONS:
+            matches = self._sorted_ids[start:end]
+        else:
+            matches = nlargest(MAX_EXPANSIONS, self._sorted_ids[start:end], key=self._df.__getitem__)
+            exact = self._term_ids.get(prefix)
+            if exact is not None and exact not in matches:
+                matches[-1] = exact
+        return [term for term in matches if self._df[term]]
+
+    def _term_id(self, token: str) -> int:
+        term = self._term_ids.get(token)
+        if term is None:
+            term = len(self._terms)
+            self._term_ids[token] = term
+            self._terms.append(sys.intern(token))
+            self._postings.append({})
+            self._df.append(0)
+            self._dead.append(0)
+            # Keep the vocabulary sorted as it grows so a new term never costs
+            # the next query a full re-sort
+            i = bisect_left(self._sorted_terms, token)
+            self._sorted_terms.insert(i, self._terms[term])
+            self._sorted_ids.insert(i, term)
+        return term
+
+    def _compact(self, term: int) -> None:
+        docs = self._docs
+        tiers = self._postings[term]
+        for key in list(tiers):
+            live = array("I", (doc for doc in tiers[key] if docs[doc] is not None))
+            if live:
+                tiers[key] = live
+            else:
+                del tiers[key]
+        self._dead[term] = 0
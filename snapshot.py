@@ -0,0 +1,128 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bid_history import BidHistory
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OMNISNAP"
+VERSION = 1
+
+# magic, version, bid log offset the snapshot is consistent with, product count
+_FILE_HEADER = struct.Struct("<8sIQI")
+# len(key), len(id), len(name), len(description), current_highest_bid,
+# auction_end_time (epoch seconds), closed, bid count, user count, len(users blob)
+_PRODUCT_HEADER = struct.Struct("<IIIIdd?QII")
+_TRAILER = struct.Struct("<I")
+# Item sizes of BidHistory's amounts, timestamps and user_ids columns
+_COLUMN_WIDTHS = tuple(getattr(BidHistory(), name).itemsize for name in ("amounts", "timestamps", "user_ids"))
+
+# A captured product: header fields plus the encoded strings and raw column bytes
+CapturedProduct = Tuple[bytes, List[bytes]]
+
+
+def capture_products(products: Dict[str, object]) -> List[CapturedProduct]:
+    """Copy every product's state into bytes.
+
+    This is the only part that has to run while bids are held off; it is a
+    handful of memcpys per product. Encoding to disk happens afterwards.
+    """
+    captured = []
+    for key, product in products.items():
+        history = product.bidding_history
+        strings = [key.encode(), product.id.encode(), product.name.encode(), product.description.encode()]
+        users = "\0".join(history.users).encode()
+        header = _PRODUCT_HEADER.pack(
+            *(len(s) for s in strings),
+            product.current_highest_bid,
+            product.auction_end_time.timestamp(),
+            product.closed,
+            len(history),
+            len(history.users),
+            len(users),
+        )
+        captured.append((header, strings + [
+            users,
+            history.amounts.tobytes(),
+            history.timestamps.tobytes(),
+            history.user_ids.tobytes(),
+        ]))
+    return captured
+
+
+def write_snapshot(path: str, captured: List[CapturedProduct], log_offset: int) -> None:
+    """Write atomically: a crash mid-write leaves the previous snapshot in place"""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    crc = 0
+    with open(tmp_path, "wb") as f:
+        def write(chunk: bytes):
+            nonlocal crc
+            crc = zlib.crc32(chunk, crc)
+            f.write(chunk)
+
+        write(_FILE_HEADER.pack(MAGIC, VERSION, log_offset, len(captured)))
+        for header, chunks in captured:
+            write(header)
+            for chunk in chunks:
+                write(chunk)
+        f.write(_TRAILER.pack(crc))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> Optional[Tuple[int, List[Dict]]]:
+    """Map a snapshot and rebuild products from it.
+
+    Returns ``(log_offset, product records)`` in the shape Storage.load_products
+    uses, or None if there is no usable snapshot.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < _FILE_HEADER.size + _TRAILER.size:
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        body_end = len(data) - _TRAILER.size
+        (crc,) = _TRAILER.unpack_from(data, body_end)
+        with memoryview(data) as view:
+            if zlib.crc32(view[:body_end]) != crc:
+                logger.warning("Ignoring corrupt snapshot %s", path)
+                return None
+            magic, version, log_offset, count = _FILE_HEADER.unpack_from(view, 0)
+            if magic != MAGIC or version != VERSION:
+                logger.warning("Ignoring snapshot %s with unknown format", path)
+                return None
+
+            records = []
+            pos = _FILE_HEADER.size
+            for _ in range(count):
+                (key_len, id_len, name_len, description_len, current_highest_bid,
+                 auction_end_time, closed, bids, user_count, users_len) = _PRODUCT_HEADER.unpack_from(view, pos)
+                pos += _PRODUCT_HEADER.size
+                fields = []
+                for length in (key_len, id_len, name_len, description_len, users_len):
+                    fields.append(bytes(view[pos:pos + length]).decode())
+                    pos += length
+                key, product_id, name, description, users = fields
+                columns = []
+                for width in _COLUMN_WIDTHS:
+                    columns.append(view[pos:pos + width * bids])
+                    pos += width * bids
+                history = BidHistory.from_columns(*columns, users.split("\0") if user_count else [])
+                for column in columns:
+                    column.release()
+                records.append({
+                    "key": key,
+                    "id": product_id,
+                    "name": name,
+                    "description": description,
+                    "current_highest_bid": current_highest_bid,
+                    "auction_end_time": datetime.fromtimestamp(auction_end_time),
+                    "closed": closed,
+                    "bidding_history": history,
+                })
+    return log_offset, records
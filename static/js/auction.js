@@ -1,9 +1,20 @@
 class AuctionWebSocket {
     constructor() {
         this.socket = null;
+        // Where we are in the server's event stream, so a reconnect only replays what we missed
+        this.lastSeq = null;
+        this.epoch = null;
+        // Product ids we've subscribed to; null means every product
+        this.topics = null;
+        // Bids sent over the socket, by request id, waiting for their ack or error
+        this.pending = new Map();
+        this.nextRequestId = 1;
+        // Field names for binary frames, sent in the hello of an omni.msgpack.v1 connection
+        this.keys = null;
         this.callbacks = {
             'bid_placed': [],
             'auction_ended': [],
+            'snapshot': [],
             'connect': [],
             'disconnect': []
         };
@@ -12,9 +23,22 @@ class AuctionWebSocket {
 
     connect() {
         const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
-        const wsUrl = `${protocol}${window.location.host}/ws`;
+        const params = new URLSearchParams();
+        if (this.lastSeq !== null) {
+            params.set('since', this.lastSeq);
+            params.set('epoch', this.epoch);
+        }
+        if (this.topics !== null) {
+            params.set('products', [...this.topics].join(','));
+        }
+        const query = params.toString();
+        const wsUrl = `${protocol}${window.location.host}/ws${query ? '?' + query : ''}`;
         
-        this.socket = new WebSocket(wsUrl);
+        // With @msgpack/msgpack loaded on the page (window.MessagePack), updates
+        // come as binary MessagePack, which is smaller and quicker to parse
+        const protocols = window.MessagePack ? ['omni.msgpack.v1', 'omni.json.v1'] : undefined;
+        this.socket = new WebSocket(wsUrl, protocols);
+        this.socket.binaryType = 'arraybuffer';
         
         this.socket.onopen = () => {
             console.log('WebSocket connected');
@@ -23,8 +47,21 @@ class AuctionWebSocket {
         
         this.socket.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
-                if (data.type && this.callbacks[data.type]) {
+                const data = this.decode(event.data);
+                if (data.epoch) {
+                    this.epoch = data.epoch;
+                }
+                if (data.seq !== undefined) {
+                    this.lastSeq = data.seq;
+                }
+                if ((data.type === 'ack' || data.type === 'error') && this.pending.has(data.request_id)) {
+                    const {resolve, reject} = this.pending.get(data.request_id);
+                    this.pending.delete(data.request_id);
+                    data.type === 'ack' ? resolve(data) : reject(new Error(data.message));
+                } else if (data.type === 'bid_batch') {
+                    // Batched bids arrive as one message; replay them as individual events
+                    data.bids.forEach(bid => this.trigger('bid_placed', bid));
+                } else if (data.type && this.callbacks[data.type]) {
                     this.trigger(data.type, data);
                 }
             } catch (e) {
@@ -34,12 +71,42 @@ class AuctionWebSocket {
         
         this.socket.onclose = () => {
             console.log('WebSocket disconnected');
+            // Their outcome is unknown; callers can check the product and retry
+            this.pending.forEach(({reject}) => reject(new Error('WebSocket disconnected')));
+            this.pending.clear();
             this.trigger('disconnect');
             // Try to reconnect after 5 seconds
             setTimeout(() => this.connect(), 5000);
         };
     }
 
+    decode(frame) {
+        if (typeof frame === 'string') {
+            return JSON.parse(frame);
+        }
+        const message = window.MessagePack.decode(new Uint8Array(frame));
+        if (message.keys) {
+            this.keys = message.keys;
+        }
+        return this.expand(message);
+    }
+
+    // Binary frames name known fields by their index in this.keys
+    expand(value) {
+        if (Array.isArray(value)) {
+            return value.map(item => this.expand(item));
+        }
+        if (value === null || typeof value !== 'object') {
+            return value;
+        }
+        const expanded = {};
+        for (const [key, item] of Object.entries(value)) {
+            const name = /^\d+$/.test(key) && this.keys ? this.keys[Number(key)] : key;
+            expanded[name === undefined ? key : name] = this.expand(item);
+        }
+        return expanded;
+    }
+
     on(event, callback) {
         if (this.callbacks[event]) {
             this.callbacks[event].push(callback);
@@ -53,17 +120,44 @@ class AuctionWebSocket {
         }
     }
 
-    sendBid(productId, amount, userId) {
+    // Only receive events for these products (call once per product page, say)
+    subscribe(productIds) {
+        this.topics = new Set([...(this.topics || []), ...productIds.map(String)]);
+        return this.sendCommand({type: 'subscribe', product_ids: productIds.map(String)});
+    }
+
+    unsubscribe(productIds) {
+        if (this.topics !== null) {
+            productIds.forEach(id => this.topics.delete(String(id)));
+        }
+        return this.sendCommand({type: 'unsubscribe', product_ids: productIds.map(String)});
+    }
+
+    sendCommand(command) {
         if (this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify(command));
+            return true;
+        }
+        // Not connected: the subscription is sent in the URL when we reconnect
+        return false;
+    }
+
+    // Resolves with the server's ack, or rejects with its error message
+    sendBid(productId, amount, userId) {
+        if (this.socket.readyState !== WebSocket.OPEN) {
+            return Promise.reject(new Error('WebSocket not connected'));
+        }
+        const requestId = String(this.nextRequestId++);
+        return new Promise((resolve, reject) => {
+            this.pending.set(requestId, {resolve, reject});
             this.socket.send(JSON.stringify({
                 type: 'place_bid',
+                request_id: requestId,
                 product_id: productId,
                 amount: amount,
                 user_id: userId
             }));
-            return true;
-        }
-        return false;
+        });
     }
 }
 
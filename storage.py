@@ -0,0 +1,325 @@
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bid_log import BidLog, BidRecord, DurabilityError
+from snapshot import capture_products, load_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Storage:
+    """What AuctionAgent persists through.
+
+    Loading happens once: ``load_products`` then ``load_bids`` (in the order
+    the bids were accepted), then ``start``. After that the agent calls
+    ``save_product`` for catalog changes, ``save_closed`` when an auction is
+    closed and ``record_bid`` for every accepted bid; ``sync`` returns a
+    future that resolves once everything recorded so far is durable. Once a
+    write fails, ``failed`` holds the DurabilityError and every later
+    ``sync`` raises it: nothing recorded since can be trusted to reach disk.
+    """
+
+    failed: Optional[DurabilityError] = None
+
+    def load_products(self) -> List[Dict]:
+        """Product fields (plus the catalog ``key``) in catalog order"""
+        raise NotImplementedError
+
+    def load_bids(self) -> Iterator[BidRecord]:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        pass
+
+    def save_product(self, key: str, product) -> None:
+        raise NotImplementedError
+
+    def save_products(self, products: List[Tuple[str, object]]) -> None:
+        for key, product in products:
+            self.save_product(key, product)
+
+    def save_closed(self, product_id: str) -> None:
+        raise NotImplementedError
+
+    def record_bid(self, product_id: str, user: str, amount: float, timestamp_ms: int) -> None:
+        raise NotImplementedError
+
+    def sync(self) -> Future:
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStorage(Storage):
+    """Catalog lives in memory; bids are made durable by an optional BidLog.
+
+    With a ``snapshot_path``, startup maps the latest snapshot of the whole
+    catalog and replays only the part of the bid log written after it. The
+    catalog is only persisted by snapshots: ``catalog_dirty`` says products
+    were saved since the last one, which should then be written soon.
+    """
+
+    def __init__(self, bid_log: Optional[BidLog] = None, snapshot_path: Optional[str] = None):
+        self.bid_log = bid_log
+        self.snapshot_path = snapshot_path
+        self.catalog_dirty = False
+        self._log_offset = 0
+
+    def load_products(self) -> List[Dict]:
+        if self.snapshot_path is None:
+            return []
+        loaded = load_snapshot(self.snapshot_path)
+        if loaded is None:
+            return []
+        log_offset, records = loaded
+        log_size = self.bid_log.size() if self.bid_log is not None else 0
+        if log_offset > log_size:
+            # The snapshot includes bids the log lost, so it can't be trusted
+            # Moved aside, or a later start could find the log grown past its offset and trust it
+            logger.error("Snapshot %s is ahead of the bid log (offset %d, log %d bytes); "
+                         "moved it to %s.stale and replaying the whole log",
+                         self.snapshot_path, log_offset, log_size, self.snapshot_path)
+            os.replace(self.snapshot_path, self.snapshot_path + ".stale")
+            return []
+        self._log_offset = log_offset
+        return records
+
+    def load_bids(self) -> Iterator[BidRecord]:
+        if self.bid_log is None:
+            return iter(())
+        return self.bid_log.replay(self._log_offset)
+
+    def capture_snapshot(self, products: Dict[str, object]):
+        """Copy catalog state; call with bids quiesced so it matches the log position"""
+        log_offset = self.bid_log.position if self.bid_log is not None else 0
+        return capture_products(products), log_offset
+
+    def write_snapshot(self, captured) -> None:
+        products, log_offset = captured
+        if self.bid_log is not None:
+            # Never point a snapshot past what is durable: if the process died
+            # first, the next start would replay from beyond the end of the log
+            self.bid_log.sync().result()
+        write_snapshot(self.snapshot_path, products, log_offset)
+        self.catalog_dirty = False
+
+    def start(self) -> None:
+        if self.bid_log is not None:
+            self.bid_log.start()
+
+    @property
+    def failed(self) -> Optional[DurabilityError]:
+        return self.bid_log.failed if self.bid_log is not None else None
+
+    def save_product(self, key: str, product) -> None:
+        self.catalog_dirty = True
+
+    def save_closed(self, product_id: str) -> None:
+        self.catalog_dirty = True
+
+    def record_bid(self, product_id: str, user: str, amount: float, timestamp_ms: int) -> None:
+        if self.bid_log is not None:
+            self.bid_log.append(product_id, user, amount, timestamp_ms)
+
+    def sync(self) -> Future:
+        if self.bid_log is None:
+            return super().sync()
+        return self.bid_log.sync()
+
+    def close(self) -> None:
+        if self.bid_log is not None:
+            self.bid_log.close()
+
+
+class SQLiteStorage(Storage):
+    """SQLite-backed catalog and bid history.
+
+    The database runs in WAL mode so readers never block the bid writer.
+    Bids are buffered and inserted by a writer thread with one prepared
+    ``executemany`` per batch inside a single transaction, which also makes
+    that transaction the group commit for every ``sync()`` waiting on it.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS products (
+            id TEXT PRIMARY KEY,
+            key TEXT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            current_highest_bid REAL NOT NULL,
+            auction_end_time REAL NOT NULL,
+            closed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS bids (
+            seq INTEGER PRIMARY KEY,
+            product_id TEXT NOT NULL,
+            user TEXT NOT NULL,
+            amount REAL NOT NULL,
+            timestamp_ms INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS bids_product_time ON bids (product_id, timestamp_ms);
+        CREATE INDEX IF NOT EXISTS bids_user ON bids (user);
+    """
+
+    INSERT_BID = "INSERT INTO bids (product_id, user, amount, timestamp_ms) VALUES (?, ?, ?, ?)"
+    UPSERT_PRODUCT = """
+        INSERT INTO products (id, key, name, description, current_highest_bid, auction_end_time, closed)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            key = excluded.key,
+            name = excluded.name,
+            description = excluded.description,
+            current_highest_bid = excluded.current_highest_bid,
+            auction_end_time = excluded.auction_end_time,
+            closed = excluded.closed
+    """
+
+    def __init__(self, path: str, batch_size: int = 5000):
+        self.path = path
+        self.batch_size = batch_size
+        self._conn = self._connect()
+        self._conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(products)")}
+        if "closed" not in columns:
+            # Databases from before closed auctions were persisted
+            with self._conn:
+                self._conn.execute("ALTER TABLE products ADD COLUMN closed INTEGER NOT NULL DEFAULT 0")
+        self._pending: List[Tuple[str, str, float, int]] = []
+        self._recorded = 0
+        self._durable = 0
+        self._waiters: List[Tuple[int, Future]] = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
+
+    def load_products(self) -> List[Dict]:
+        rows = self._conn.execute(
+            "SELECT key, id, name, description, current_highest_bid, auction_end_time, closed "
+            "FROM products ORDER BY rowid"
+        )
+        return [
+            {
+                "key": key,
+                "id": product_id,
+                "name": name,
+                "description": description,
+                "current_highest_bid": current_highest_bid,
+                "auction_end_time": datetime.fromtimestamp(auction_end_time),
+                "closed": bool(closed),
+            }
+            for key, product_id, name, description, current_highest_bid, auction_end_time, closed in rows
+        ]
+
+    def load_bids(self) -> Iterator[BidRecord]:
+        cursor = self._conn.execute("SELECT product_id, user, amount, timestamp_ms FROM bids ORDER BY seq")
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                return
+            yield from rows
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._writer, name="sqlite-bid-writer", daemon=True)
+        self._thread.start()
+
+    def save_product(self, key: str, product) -> None:
+        with self._conn:
+            self._conn.execute(self.UPSERT_PRODUCT, (
+                product.id, key, product.name, product.description,
+                product.current_highest_bid, product.auction_end_time.timestamp(), product.closed,
+            ))
+
+    def save_closed(self, product_id: str) -> None:
+        with self._conn:
+            self._conn.execute("UPDATE products SET closed = 1 WHERE id = ?", (product_id,))
+
+    def save_products(self, products: List[Tuple[str, object]]) -> None:
+        with self._conn:
+            self._conn.executemany(self.UPSERT_PRODUCT, [
+                (product.id, key, product.name, product.description,
+                 product.current_highest_bid, product.auction_end_time.timestamp(), product.closed)
+                for key, product in products
+            ])
+
+    def record_bid(self, product_id: str, user: str, amount: float, timestamp_ms: int) -> None:
+        with self._cond:
+            if self.failed is not None:
+                return
+            self._pending.append((product_id, user, amount, timestamp_ms))
+            self._recorded += 1
+            self._cond.notify()
+
+    def sync(self) -> Future:
+        future = Future()
+        with self._cond:
+            if self.failed is not None:
+                future.set_exception(DurabilityError(str(self.failed)))
+                return future
+            target = self._recorded
+            if target <= self._durable:
+                future.set_result(target)
+                return future
+            self._waiters.append((target, future))
+        return future
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._conn.close()
+
+    def _writer(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                with self._cond:
+                    while not self._pending and not self._closing:
+                        self._cond.wait()
+                    if not self._pending:
+                        return
+                    batch = self._pending[:self.batch_size]
+                    del self._pending[:self.batch_size]
+                    batch_end = self._recorded - len(self._pending)
+                try:
+                    with conn:
+                        conn.executemany(self.INSERT_BID, batch)
+                except Exception as exc:
+                    # Fail-stop, as in BidLog: a later batch committing must not
+                    # make these bids look durable
+                    logger.exception("Failed to write %d bids to %s; no more bids can be made durable",
+                                     len(batch), self.path)
+                    with self._cond:
+                        self.failed = DurabilityError(f"Bid database {self.path} failed: {exc}")
+                        failed, self._waiters = self._waiters, []
+                        self._pending = []
+                    for _, future in failed:
+                        future.set_exception(DurabilityError(str(self.failed)))
+                    return
+                with self._cond:
+                    self._durable = batch_end
+                    done = [future for target, future in self._waiters if target <= batch_end]
+                    self._waiters = [(target, future) for target, future in self._waiters if target > batch_end]
+                for future in done:
+                    future.set_result(batch_end)
+        finally:
+            conn.close()
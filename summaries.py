@@ -0,0 +1,115 @@
+import json
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from auction_agent import format_remaining
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+def dumps(obj) -> bytes:
+    """Compact JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+class SummaryCache:
+    """Product summaries serialized once per product version.
+
+    Everything in a summary except ``time_remaining`` only changes with the
+    product's version, so that part is kept as ready-made JSON (minus its
+    closing brace) and a response is a byte join of those fragments with the
+    current countdown spliced in, instead of a dict per product that then
+    has to be validated and encoded. At most ``max_entries`` products are
+    kept, oldest first out.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # product id -> (version, ends_at or None once closed, fragment)
+        self._fragments: Dict[str, Tuple[int, Optional[float], bytes]] = {}
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def encode(self, product, now: Optional[float] = None, extra: bytes = b"") -> bytes:
+        """One product's summary as JSON; ``extra`` is spliced in as more ``,"key":value`` members"""
+        entry = self._fragments.get(product.id)
+        if entry is None or entry[0] != product.version:
+            entry = self._build(product)
+        remaining = "Auction has ended" if entry[1] is None else format_remaining(
+            entry[1] - (time.time() if now is None else now))
+        return b"".join((entry[2], b',"time_remaining":"', remaining.encode(), b'"', extra, b"}"))
+
+    def encode_list(self, products: Iterable, now: Optional[float] = None) -> bytes:
+        if now is None:
+            now = time.time()
+        fragments = self._fragments
+        # Each product's closing ``"time_remaining": ...},`` by whole seconds left;
+        # listings tend to share end times, and so these
+        tails: Dict[int, bytes] = {}
+        parts = [b"["]
+        for product in products:
+            entry = fragments.get(product.id)
+            if entry is None or entry[0] != product.version:
+                entry = self._build(product)
+            remaining = -1.0 if entry[1] is None else entry[1] - now
+            seconds = int(remaining) if remaining > 0 else -1
+            tail = tails.get(seconds)
+            if tail is None:
+                remaining = format_remaining(remaining)
+                tail = tails[seconds] = b',"time_remaining":"' + remaining.encode() + b'"},'
+            parts.append(entry[2])
+            parts.append(tail)
+        if len(parts) > 1:
+            parts[-1] = parts[-1][:-1]
+        parts.append(b"]")
+        return b"".join(parts)
+
+    def _build(self, product) -> Tuple[int, Optional[float], bytes]:
+        ends_at = product.auction_end_time.timestamp()
+        fragment = dumps({
+            "id": product.id,
+            "name": product.name,
+            "description": product.description,
+            "current_highest_bid": product.current_highest_bid,
+            "ends_at": ends_at,
+            "bids_count": len(product.bidding_history)
+        })[:-1]
+        entry = (product.version, None if product.closed else ends_at, fragment)
+        fragments = self._fragments
+        if product.id not in fragments and len(fragments) >= self.max_entries:
+            del fragments[next(iter(fragments))]
+        fragments[product.id] = entry
+        return entry
+
+
+def summary(product, now: Optional[float] = None) -> dict:
+    """The same summary as a dict, for responses that pick fields from it"""
+    return {
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "current_highest_bid": product.current_highest_bid,
+        "time_remaining": product.time_remaining(now),
+        "ends_at": product.auction_end_time.timestamp(),
+        "bids_count": len(product.bidding_history)
+    }
+
+
+def history_rows(history, start: int, end: int, epoch: bool = False) -> List[dict]:
+    """Bids ``start`` to ``end`` of a BidHistory; timestamps in epoch ms with ``epoch``, else ISO 8601"""
+    rows = history[start:end]
+    if epoch:
+        return [{"user": bid.user, "amount": bid.amount, "timestamp": bid.timestamp_ms} for bid in rows]
+    return [
+        {"user": bid.user, "amount": bid.amount, "timestamp": datetime.fromtimestamp(bid.timestamp_ms / 1000).isoformat()}
+        for bid in rows
+    ]
@@ -5,6 +5,9 @@ async def test_websocket():
     try:
         async with websockets.connect('ws://localhost:8000/ws') as websocket:
             print("Successfully connected to WebSocket!")
+            # The server greets every connection with its current seq and epoch
+            hello = await websocket.recv()
+            print(f"Received: {hello}")
             # Send a test message
             await websocket.send("Hello, WebSocket!")
             # Wait for a response
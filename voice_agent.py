@@ -5,13 +5,16 @@ import websockets
 from typing import Dict, Optional, List
 import requests
 from datetime import datetime
+from urllib.parse import urlencode
 import logging
 import speech_recognition as sr
 from gtts import gTTS
 import pygame
 import io
 import time
+import uuid
 from dataclasses import dataclass, asdict
+from ws_protocol import loads, protocols
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +22,8 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 API_BASE_URL = "http://localhost:8000/api"
+BID_ATTEMPTS = 3
+BID_TIMEOUT = 5
 
 @dataclass
 class AuctionItem:
@@ -38,6 +43,13 @@ class VoiceAgent:
             "last_bid_amount": None
         }
         self.websocket = None
+        # Position in the server's event stream, so reconnects resume instead of losing bids
+        self.last_seq = None
+        self.epoch = None
+        # Products we want live bids for; the server only sends us those
+        self.watched = set()
+        # url -> (ETag, JSON) of the last response, revalidated instead of refetched
+        self.http_cache = {}
         self.use_voice = use_voice
         self.recognizer = sr.Recognizer() if use_voice else None
         pygame.mixer.init()
@@ -93,7 +105,15 @@ class VoiceAgent:
     async def connect_to_websocket(self):
         """Connect to the WebSocket server for real-time updates"""
         try:
-            self.websocket = await websockets.connect("ws://localhost:8000/ws")
+            params = {}
+            if self.last_seq is not None:
+                # Resume where we left off instead of silently missing bids
+                params.update(since=self.last_seq, epoch=self.epoch)
+            # Subscribe to nothing until the user picks a product
+            params["products"] = ",".join(sorted(self.watched))
+            # Binary MessagePack updates when msgpack is installed here and on the server, else JSON
+            self.websocket = await websockets.connect(f"ws://localhost:8000/ws?{urlencode(params)}",
+                                                      subprotocols=protocols())
             logger.info("Connected to WebSocket server")
             # Start listening for updates in the background
             asyncio.create_task(self.listen_for_updates())
@@ -104,16 +124,42 @@ class VoiceAgent:
         """Listen for real-time updates from the WebSocket"""
         try:
             async for message in self.websocket:
-                data = json.loads(message)
+                data = loads(message)
                 logger.info(f"Received update: {data}")
+                self.epoch = data.get('epoch', self.epoch)
+                self.last_seq = data.get('seq', self.last_seq)
                 # Handle different types of updates
-                if data.get('type') == 'bid_placed':
+                if data.get('type') == 'snapshot':
+                    # Too far behind to replay; refresh cached listings from the snapshot
+                    state = {p['id']: p for p in data.get('products', [])}
+                    for item in self.context["last_products_list"]:
+                        if item.id in state:
+                            item.current_highest_bid = state[item.id]['current_highest_bid']
+                            item.time_remaining = state[item.id]['time_remaining']
+                elif data.get('type') == 'bid_placed':
                     await self.handle_bid_update(data)
+                elif data.get('type') == 'bid_batch':
+                    for bid in data.get('bids', []):
+                        await self.handle_bid_update(bid)
+                elif data.get('type') == 'auction_ended':
+                    winner = data.get('winner') or 'no bidders'
+                    print(f"\n[SYSTEM] Auction ended for {data.get('name')}: ${data.get('final_bid', 0):.2f} ({winner})\n")
         except websockets.exceptions.ConnectionClosed:
             logger.warning("WebSocket connection closed, attempting to reconnect...")
             await asyncio.sleep(5)  # Wait before reconnecting
             await self.connect_to_websocket()
     
+    async def watch_product(self, product_id: str):
+        """Subscribe to live bids for a product the user is looking at or bidding on"""
+        if product_id in self.watched:
+            return
+        self.watched.add(product_id)
+        if self.websocket is not None:
+            try:
+                await self.websocket.send(json.dumps({"type": "subscribe", "product_ids": [product_id]}))
+            except websockets.exceptions.ConnectionClosed:
+                pass  # Sent in the URL on reconnect
+    
     async def handle_bid_update(self, data: Dict):
         """Handle incoming bid updates"""
         product_id = data.get('product_id')
@@ -122,17 +168,41 @@ class VoiceAgent:
         
         # Only notify if it's not the current user
         if user != self.context.get('user_name'):
-            product = await self.get_product_by_id(product_id)
+            # Name from what we've already listed; no request per bid
+            product = next((p for p in self.context["last_products_list"] if p.id == product_id), None)
             if product:
-                # In a real implementation, you would use TTS to announce this
-                print(f"\n[SYSTEM] New bid on {product.name}: ${amount:.2f} by {user}\n")
+                product.current_highest_bid = amount
+            name = product.name if product else f"product {product_id}"
+            # In a real implementation, you would use TTS to announce this
+            print(f"\n[SYSTEM] New bid on {name}: ${amount:.2f} by {user}\n")
+    
+    def _get_json(self, url: str):
+        """GET with If-None-Match, reusing our last copy when the server answers 304"""
+        cached = self.http_cache.get(url)
+        response = requests.get(url, headers={"If-None-Match": cached[0]} if cached else {})
+        if response.status_code == 304:
+            return cached[1]
+        response.raise_for_status()
+        data = response.json()
+        if "ETag" in response.headers:
+            self.http_cache[url] = (response.headers["ETag"], data)
+        return data
+    
+    @staticmethod
+    def _time_remaining(p: Dict) -> str:
+        # A revalidated copy can be old; recount from the absolute end time
+        if "ends_at" not in p:
+            return p["time_remaining"]
+        remaining = int(p["ends_at"] - time.time())
+        if remaining <= 0:
+            return "Auction has ended"
+        minutes, seconds = divmod(remaining, 60)
+        return f"{minutes}m {seconds}s remaining"
     
     async def get_products(self) -> List[AuctionItem]:
         """Fetch all available auction items"""
         try:
-            response = requests.get(f"{API_BASE_URL}/products")
-            response.raise_for_status()
-            products = response.json()
+            products = self._get_json(f"{API_BASE_URL}/products")
             
             # Cache the products for reference
             self.context["last_products_list"] = [
@@ -140,7 +210,7 @@ class VoiceAgent:
                     id=p["id"],
                     name=p["name"],
                     current_highest_bid=p["current_highest_bid"],
-                    time_remaining=p["time_remaining"],
+                    time_remaining=self._time_remaining(p),
                     description=p["description"]
                 ) for p in products
             ]
@@ -152,27 +222,57 @@ class VoiceAgent:
     async def get_product_by_id(self, product_id: str) -> Optional[AuctionItem]:
         """Fetch a specific product by ID"""
         try:
-            response = requests.get(f"{API_BASE_URL}/products/{product_id}")
-            response.raise_for_status()
-            p = response.json()
+            p = self._get_json(f"{API_BASE_URL}/products/{product_id}")
             return AuctionItem(
                 id=p["id"],
                 name=p["name"],
                 current_highest_bid=p["current_highest_bid"],
-                time_remaining=p["time_remaining"],
+                time_remaining=self._time_remaining(p),
                 description=p["description"]
             )
         except Exception as e:
             logger.error(f"Error fetching product {product_id}: {e}")
             return None
     
+    async def search_products(self, query: str, limit: int = 5) -> List[AuctionItem]:
+        """Search live auctions by name or description, best match first"""
+        try:
+            response = requests.get(f"{API_BASE_URL}/search", params={"q": query, "limit": limit})
+            response.raise_for_status()
+            return [
+                AuctionItem(
+                    id=p["id"],
+                    name=p["name"],
+                    current_highest_bid=p["current_highest_bid"],
+                    time_remaining=p["time_remaining"],
+                    description=p["description"]
+                ) for p in response.json()
+            ]
+        except Exception as e:
+            logger.error(f"Error searching products: {e}")
+            return []
+    
     async def place_bid(self, product_id: str, amount: float, user: str) -> Dict:
-        """Place a bid on a product"""
+        """Place a bid on a product, retrying timeouts and dropped connections
+        under one Idempotency-Key so a retry can never become a second bid"""
         try:
-            response = requests.post(
-                f"{API_BASE_URL}/bids",
-                json={"product_id": product_id, "user": user, "amount": amount}
-            )
+            key = uuid.uuid4().hex
+            for attempt in range(BID_ATTEMPTS):
+                try:
+                    response = requests.post(
+                        f"{API_BASE_URL}/bids",
+                        json={"product_id": product_id, "user": user, "amount": amount},
+                        headers={"Idempotency-Key": key},
+                        timeout=BID_TIMEOUT
+                    )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if attempt == BID_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                if response.status_code not in (429, 503) or attempt == BID_ATTEMPTS - 1:
+                    break
+                await asyncio.sleep(float(response.headers.get("Retry-After", 0.5 * 2 ** attempt)))
             response.raise_for_status()
             
             # Update context
@@ -252,23 +352,27 @@ class VoiceAgent:
                                 product_ref = product.name
                                 break
                     
-                    # If still no match, try to find the most similar product name
-                    if not product_ref and len(self.context["last_products_list"]) > 0:
-                        from difflib import get_close_matches
-                        all_product_names = [p.name.lower() for p in self.context["last_products_list"]]
-                        # Get words from command that might be product names
-                        command_terms = [word for word in command_lower.split() if len(word) > 3]
-                        for term in command_terms:
-                            matches = get_close_matches(term, all_product_names, n=1, cutoff=0.6)
-                            if matches:
-                                product_ref = matches[0]
-                                break
+                # If still no match, ask the server's search index, which also
+                # covers products we haven't listed and matches descriptions
+                searched = None
+                if not product_ref:
+                    # Get words from command that might be product names
+                    query = command
+                    for phrase in detail_phrases:
+                        query = query.replace(phrase, " ")
+                    command_terms = [word for word in query.split() if len(word) > 3]
+                    for term in command_terms:
+                        matches = await self.search_products(term, limit=1)
+                        if matches:
+                            searched = matches[0]
+                            product_ref = searched.name
+                            break
                 
                 if not product_ref:
                     return "I'm not sure which product you're asking about. Please say something like 'Tell me about the iPhone' or 'Show me item 1'."
                 
                 # Find the product in our list
-                product = next((p for p in self.context["last_products_list"] 
+                product = searched or next((p for p in self.context.get("last_products_list", [])
                               if product_ref.lower() in p.name.lower()), None)
                 
                 if not product:
@@ -281,6 +385,7 @@ class VoiceAgent:
                 
                 # Update context with the current product
                 self.context["current_product"] = product
+                await self.watch_product(product.id)
                 
                 # Format the response
                 return (
@@ -305,6 +410,7 @@ class VoiceAgent:
                         for product in self.context["last_products_list"]:
                             if any(term in command for term in product.name.lower().split()):
                                 self.context["current_product"] = product
+                                await self.watch_product(product.id)
                                 break
                     
                     if not self.context.get("current_product"):
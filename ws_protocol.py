@@ -0,0 +1,101 @@
+import json
+from typing import Any, List, Optional, Sequence, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# WebSocket subprotocols /ws speaks. A client that asks for none gets JSON
+# text frames, as before; one that asks for MSGPACK_PROTOCOL (when the server
+# has msgpack installed) gets binary MessagePack frames instead.
+JSON_PROTOCOL = "omni.json.v1"
+MSGPACK_PROTOCOL = "omni.msgpack.v1"
+
+# On MessagePack connections field names listed here go on the wire as their
+# index in this table, a single byte, rather than as a string; anything else
+# goes by name. The table is sent in the ``keys`` field of the ``hello`` that
+# opens each connection. Only ever append to it: changing what an index means
+# needs a new protocol version.
+KEYS = (
+    "type", "seq", "epoch", "product_id", "user", "amount", "message", "absorbed", "bids", "products",
+    "id", "current_highest_bid", "time_remaining", "bids_count", "ended", "name", "final_bid", "winner",
+    "request_id", "product_ids", "retry_after", "user_id", "expected_highest", "protocol",
+)
+_KEY_IDS = {name: index for index, name in enumerate(KEYS)}
+
+
+def protocols() -> List[str]:
+    """The subprotocols this server (or client) can speak, most compact first"""
+    return [MSGPACK_PROTOCOL, JSON_PROTOCOL] if msgpack is not None else [JSON_PROTOCOL]
+
+
+def negotiate(requested: Sequence[str]) -> Optional[str]:
+    """The first of the client's subprotocols that is supported, or None to answer
+    with no subprotocol (and JSON)"""
+    supported = protocols()
+    for protocol in requested:
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def _compact(message: dict) -> dict:
+    compact = {}
+    for key, value in message.items():
+        if value.__class__ is dict:
+            value = _compact(value)
+        elif value.__class__ is list:
+            value = [_compact(item) if item.__class__ is dict else item for item in value]
+        compact[_KEY_IDS.get(key, key)] = value
+    return compact
+
+
+def _expand(message: dict) -> dict:
+    expanded = {}
+    for key, value in message.items():
+        if value.__class__ is dict:
+            value = _expand(value)
+        elif value.__class__ is list:
+            value = [_expand(item) if item.__class__ is dict else item for item in value]
+        expanded[KEYS[key] if key.__class__ is int and key < len(KEYS) else key] = value
+    return expanded
+
+
+def encode(message: dict) -> bytes:
+    """A message as MessagePack with its field names replaced by their KEYS index"""
+    return msgpack.packb(_compact(message))
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse one frame from either side: JSON text, or MessagePack bytes from ``encode``"""
+    if isinstance(data, str):
+        return json.loads(data)
+    if msgpack is None:
+        raise ValueError("MessagePack frame received but msgpack is not installed")
+    message = msgpack.unpackb(data, strict_map_key=False)
+    return _expand(message) if isinstance(message, dict) else message
+
+
+class Frame:
+    """One outgoing message, serialized at most once per wire format and then
+    shared by every connection speaking that format"""
+
+    __slots__ = ("message", "_text", "_binary")
+
+    def __init__(self, message: dict, text: Optional[str] = None):
+        self.message = message
+        self._text = text
+        self._binary: Optional[bytes] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = json.dumps(self.message)
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = encode(self.message)
+        return self._binary